@@ -0,0 +1,92 @@
+"""
+Evaluación offline del retriever: recall frente a un pequeño conjunto de preguntas etiquetadas.
+
+Cada pregunta de eval/preguntas.jsonl lista uno o más fragmentos de texto que deben aparecer
+en algún chunk recuperado. Se comparan el retriever vectorial original (k=15, todo al prompt)
+y el híbrido (BM25 + vectores, sin duplicados, con presupuesto de tokens).
+
+Métricas por modo:
+  - hit rate: preguntas en las que algún chunk recuperado contiene lo esperado
+  - recall medio: fracción de los fragmentos esperados que aparecen en el contexto
+  - tokens medios de contexto enviados al LLM
+
+Uso:
+    python RAG/evaluar_retriever.py
+    python RAG/evaluar_retriever.py --preguntas RAG/eval/preguntas.jsonl --presupuesto 1000
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from langchain_openai import OpenAIEmbeddings
+
+# rag.py ya agrega la raíz del repo al sys.path
+from rag import crear_vector_store, RAG_DIR
+from bot.embedding_cache import CachedEmbeddings
+from bot.hybrid_retriever import HybridRetriever, cargar_corpus_supabase, contar_tokens, RAG_CONTEXT_TOKENS
+from bot.local_vector_store import VECTOR_STORE_BACKEND
+
+
+def compactar(texto):
+    # Sin espacios ni mayúsculas: el texto extraído del PDF a veces parte palabras ("T iene")
+    return re.sub(r"\s+", "", texto).lower()
+
+
+def evaluar(nombre, recuperar, preguntas):
+    hits, recall_total, tokens_total, tiempo_total = 0, 0.0, 0, 0.0
+    for item in preguntas:
+        inicio = time.perf_counter()
+        documentos = recuperar(item["pregunta"])
+        tiempo_total += time.perf_counter() - inicio
+
+        contexto = compactar(" ".join(d.page_content for d in documentos))
+        encontrados = sum(1 for esperado in item["esperado"] if compactar(esperado) in contexto)
+        hits += encontrados > 0
+        recall_total += encontrados / len(item["esperado"])
+        tokens_total += sum(contar_tokens(d.page_content) for d in documentos)
+        if not encontrados:
+            print(f"  [{nombre}] sin recuperar: {item['pregunta']}")
+
+    n = len(preguntas)
+    return {
+        "modo": nombre,
+        "hit_rate": hits / n,
+        "recall": recall_total / n,
+        "tokens_contexto": tokens_total / n,
+        "latencia_ms": tiempo_total / n * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preguntas", default=os.path.join(RAG_DIR, "eval", "preguntas.jsonl"))
+    parser.add_argument("--presupuesto", type=int, default=RAG_CONTEXT_TOKENS, help="Tokens de contexto del híbrido")
+    args = parser.parse_args()
+
+    with open(args.preguntas, "r", encoding="utf-8") as f:
+        preguntas = [json.loads(linea) for linea in f if linea.strip()]
+
+    embedding_model = CachedEmbeddings(OpenAIEmbeddings(model='text-embedding-ada-002'))
+    vector_store = crear_vector_store(embedding_model)
+    if VECTOR_STORE_BACKEND == "local":
+        cargar_corpus = lambda: vector_store.get_all()[1:]
+    else:
+        cargar_corpus = lambda: cargar_corpus_supabase(vector_store._client)
+
+    vectorial = vector_store.as_retriever(search_kwargs={'k': 15})
+    hibrido = HybridRetriever(vector_store, cargar_corpus, token_budget=args.presupuesto)
+    # El corpus se carga en segundo plano: sin esperar, las primeras preguntas serían solo vectoriales
+    if not hibrido.esperar_indice():
+        raise SystemExit("No se pudo cargar el corpus para BM25")
+
+    resultados = [
+        evaluar("vector", vectorial.invoke, preguntas),
+        evaluar("hybrid", hibrido.invoke, preguntas),
+    ]
+
+    print(f"\n{len(preguntas)} preguntas, backend {VECTOR_STORE_BACKEND}")
+    print(f"{'modo':<8}{'hit rate':>10}{'recall':>10}{'tokens ctx':>12}{'latencia ms':>13}")
+    for r in resultados:
+        print(f"{r['modo']:<8}{r['hit_rate']:>10.2%}{r['recall']:>10.2%}{r['tokens_contexto']:>12.0f}{r['latencia_ms']:>13.1f}")
@@ -1,4 +1,35 @@
+"""
+Ingesta incremental de la base de conocimientos.
+
+Cada chunk se identifica por el hash de su contenido. El manifiesto (ingest_manifest.json)
+guarda los chunks ya ingestados, así que en cada ejecución solo se embeben y suben los
+chunks nuevos o modificados y se borran los que ya no existen.
+
+Los archivos de un directorio (PDF, Markdown, TXT) se parsean y dividen en chunks en un
+pool de procesos; los chunks fluyen en lotes acotados hacia los embeddings y el vector
+store, así que la memoria no crece con el tamaño del corpus.
+
+La primera ejecución sin manifiesto para el backend (o con --reset) borra antes las filas
+existentes de los archivos ingestados: las que dejó la ingesta anterior con from_documents
+tienen ids aleatorios y, si no, quedarían duplicadas junto a las nuevas.
+
+Uso:
+    python RAG/rag.py                                  # todo RAG/Base_de_Conocimientos
+    python RAG/rag.py --dir otra/carpeta --procesos 4
+    python RAG/rag.py --pdf RAG/Base_de_Conocimientos/SOBRE_DATAPATH.pdf
+    python RAG/rag.py --reset                          # borra y vuelve a ingestar lo del directorio
+"""
+import argparse
+import hashlib
+import json
 import os
+import sys
+import time
+import uuid
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from langchain_core.documents import Document
 
 #Paso 1: Elección de la Técnica de DocumentLoader
 from langchain_community. document_loaders import PyPDFLoader
@@ -9,25 +40,42 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter #Mi técnica
 #Paso 3: Elección del Modelo de Word Embedding
 from langchain_openai import OpenAIEmbeddings
 
-#Paso 4: Elección de BaSE DE datos Vectorial
-from langchain_chroma import Chroma
-
 from dotenv import load_dotenv
 load_dotenv()
 
+# Para poder importar los módulos del bot al ejecutar este script desde la carpeta RAG
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bot.embedding_cache import CachedEmbeddings
+from bot.local_vector_store import LocalVectorStore, VECTOR_STORE_BACKEND
+
 #Importanciones para trabajar con SUPABASE
 from langchain_community.vectorstores import SupabaseVectorStore
 from supabase import create_client
 
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+DIR_POR_DEFECTO = os.path.join(RAG_DIR, "Base_de_Conocimientos")
+MANIFEST_PATH = os.path.join(RAG_DIR, "ingest_manifest.json")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EXTENSIONES = (".pdf", ".md", ".markdown", ".txt")
 
-if __name__ == '__main__':
-    #----------------------------- Paso 1: Documment Loader---------------------------------------------
-    path = "Base_de_Conocimientos/SOBRE_DATAPATH.pdf" #HAY QUE AGREGAR LUEGO ESE DNI
-    loader = PyPDFLoader(path)
-    documentos = loader.load()
 
+def nombre_source(path):
+    """Ruta relativa a RAG/: el mismo archivo tiene el mismo source (y los mismos ids) se llame como se llame."""
+    return os.path.relpath(os.path.abspath(path), RAG_DIR)
+
+
+#------------------------------ Código que corre en los procesos hijos ------------------------------
+def parsear_archivo(path):
+    """Carga y divide un archivo en chunks. Devuelve (páginas, [(texto, metadata)])."""
+    source = nombre_source(path)
+    if path.lower().endswith(".pdf"):
+        documentos = PyPDFLoader(path).load()
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            documentos = [Document(page_content=f.read(), metadata={})]
+    for documento in documentos:
+        documento.metadata["source"] = source
 
-    #-------------------------------- Paso 2: Chunking -------------------------------------------------
     text_splitter =  RecursiveCharacterTextSplitter(
         chunk_size = 1000,
         chunk_overlap = 200,
@@ -35,21 +83,274 @@ if __name__ == '__main__':
     chunks = text_splitter.split_documents(
         documents=documentos
     )
+    return len(documentos), [(chunk.page_content, chunk.metadata) for chunk in chunks]
+#----------------------------------------------------------------------------------------------------
+
+
+def listar_archivos(directorio):
+    for raiz, _, archivos in os.walk(directorio):
+        for archivo in sorted(archivos):
+            if archivo.lower().endswith(EXTENSIONES):
+                yield os.path.join(raiz, archivo)
+
+
+def chunks_en_paralelo(archivos, procesos, estadisticas):
+    """Genera los chunks de todos los archivos, parseados en un pool de procesos.
+
+    Como mucho hay 2 archivos en vuelo por proceso: si el embedding va más lento que el
+    parseo, el pool espera en lugar de acumular chunks en memoria.
+    """
+    archivos = iter(archivos)
+    max_en_vuelo = procesos * 2
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        en_vuelo = set()
+        while True:
+            for archivo in archivos:
+                en_vuelo.add(executor.submit(parsear_archivo, archivo))
+                if len(en_vuelo) >= max_en_vuelo:
+                    break
+            if not en_vuelo:
+                return
+            listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for future in listos:
+                paginas, chunks = future.result()
+                estadisticas["archivos"] += 1
+                estadisticas["paginas"] += paginas
+                for texto, metadata in chunks:
+                    yield Document(page_content=texto, metadata=metadata)
 
-    print(chunks)
 
-    #---------- Paso 3: Embeddings - Convertir los documentos de mi PDF a Embeddings --------------------
-    embedding_model = OpenAIEmbeddings(model='text-embedding-ada-002')
+def hash_chunk(chunk):
+    return hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+
+
+def id_chunk(source, contenido_hash):
+    """ID estable del chunk: mismo archivo + mismo contenido => mismo id (en formato UUID, como la tabla documents)."""
+    return str(uuid.UUID(hashlib.sha256(f"{source}\0{contenido_hash}".encode("utf-8")).hexdigest()[:32]))
+
+
+def cargar_manifest():
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_manifest(manifest):
+    with open(f"{MANIFEST_PATH}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{MANIFEST_PATH}.tmp", MANIFEST_PATH)
+
+
+def crear_vector_store(embedding_model):
+    if VECTOR_STORE_BACKEND == "local":
+        # Índice local en RAG/vector_index (VECTOR_STORE_BACKEND=local)
+        return LocalVectorStore(embedding_model)
 
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
 
     client = create_client(supabase_url, supabase_key)
 
-    vectorstore = SupabaseVectorStore.from_documents(
-        documents=chunks,
-        embedding=embedding_model,
+    return SupabaseVectorStore(
         client=client,
+        embedding=embedding_model,
         table_name="documents", #Esta es la tabla que creé
         query_name="match_documents",
-    )
\ No newline at end of file
+    )
+
+
+def filas_existentes(vector_store, page_size=1000):
+    """Genera (id, source) de todas las filas que ya tiene el vector store."""
+    if isinstance(vector_store, LocalVectorStore):
+        ids, _, metadatos = vector_store.get_all()
+        for chunk_id, metadata in zip(ids, metadatos):
+            yield chunk_id, (metadata or {}).get("source", "")
+        return
+    inicio = 0
+    while True:
+        response = (
+            vector_store._client.table("documents")
+            .select("id, metadata")
+            .range(inicio, inicio + page_size - 1)
+            .execute()
+        )
+        filas = response.data or []
+        for fila in filas:
+            yield str(fila["id"]), (fila.get("metadata") or {}).get("source", "")
+        if len(filas) < page_size:
+            return
+        inicio += page_size
+
+
+def limpiar_filas_previas(vector_store, manifest, en_alcance):
+    """Borra las filas de los archivos en alcance que el manifiesto no registra y lo vacía para el backend."""
+    inicio = time.perf_counter()
+    borrar = [chunk_id for chunk_id, source in filas_existentes(vector_store) if en_alcance(source)]
+    if borrar:
+        vector_store.delete(ids=borrar)
+    anteriores = manifest.get(VECTOR_STORE_BACKEND, {})
+    manifest[VECTOR_STORE_BACKEND] = {
+        chunk_id: info for chunk_id, info in anteriores.items() if not en_alcance(info["source"])
+    }
+    guardar_manifest(manifest)
+    print(f"{len(borrar)} filas previas borradas en {time.perf_counter() - inicio:.2f} s")
+
+
+def reconciliar_manifest_local(manifest, vector_store):
+    """Quita del manifiesto los chunks que el índice local no tiene.
+
+    El índice local escribe su meta.json al final de la ingesta (en_lote); si una ejecución
+    se cortó después de guardar el manifiesto de algún lote, esos chunks se vuelven a subir.
+    """
+    anteriores = manifest.get(VECTOR_STORE_BACKEND, {})
+    en_indice = set(vector_store.get_all()[0])
+    perdidos = [chunk_id for chunk_id in anteriores if chunk_id not in en_indice]
+    for chunk_id in perdidos:
+        del anteriores[chunk_id]
+    if perdidos:
+        print(f"{len(perdidos)} chunks del manifiesto no están en el índice local: se volverán a subir")
+
+
+def sincronizar(chunks, vector_store, manifest, tiempos, en_alcance=lambda source: True):
+    """Compara los chunks con el manifiesto, sube los nuevos/modificados y borra los eliminados.
+
+    `chunks` puede ser un generador: se consume en lotes de EMBED_BATCH_SIZE y nunca se
+    materializa entero. Solo se borran chunks cuyo source está dentro de lo ingestado.
+    """
+    anteriores = manifest.get(VECTOR_STORE_BACKEND, {})
+    actuales = {}
+    nuevos = []
+    tiempos.setdefault("embeddings_y_upsert", 0.0)
+
+    def subir(lote):
+        inicio = time.perf_counter()
+        vector_store.add_documents([chunk for _, chunk in lote], ids=[chunk_id for chunk_id, _ in lote])
+        # Guardamos el avance por lote: si se corta, la siguiente ejecución retoma desde aquí
+        for chunk_id, _ in lote:
+            anteriores[chunk_id] = actuales[chunk_id]
+        manifest[VECTOR_STORE_BACKEND] = anteriores
+        guardar_manifest(manifest)
+        tiempos["embeddings_y_upsert"] += time.perf_counter() - inicio
+        print(f"  Lote de {len(lote)} chunks embebidos y subidos ({len(nuevos)} en total)")
+
+    #---------- Embeddings + upsert por lotes: solo los chunks nuevos o modificados -------------------
+    posiciones = {}
+    lote = []
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        posicion = posiciones[source] = posiciones.get(source, -1) + 1
+        contenido_hash = hash_chunk(chunk)
+        chunk_id = id_chunk(source, contenido_hash)
+        if chunk_id in actuales:
+            continue # Chunk repetido dentro del mismo archivo
+        actuales[chunk_id] = {"hash": contenido_hash, "source": source, "posicion": posicion}
+        if chunk_id not in anteriores:
+            nuevos.append(chunk_id)
+            lote.append((chunk_id, chunk))
+            if len(lote) >= EMBED_BATCH_SIZE:
+                subir(lote)
+                lote = []
+    if lote:
+        subir(lote)
+
+    inicio = time.perf_counter()
+    eliminados = [
+        chunk_id for chunk_id, info in anteriores.items()
+        if chunk_id not in actuales and en_alcance(info["source"])
+    ]
+
+    # Un chunk "modificado" es uno nuevo que ocupa la posición de uno eliminado del mismo archivo
+    posiciones_eliminadas = {(anteriores[i]["source"], anteriores[i]["posicion"]) for i in eliminados}
+    modificados = sum(
+        1 for chunk_id in nuevos
+        if (actuales[chunk_id]["source"], actuales[chunk_id]["posicion"]) in posiciones_eliminadas
+    )
+    tiempos["diff"] = time.perf_counter() - inicio
+
+    #---------- Borrado de los chunks que ya no existen ----------------------------------------------
+    inicio = time.perf_counter()
+    if eliminados:
+        vector_store.delete(ids=eliminados)
+    tiempos["borrado"] = time.perf_counter() - inicio
+
+    for chunk_id in eliminados:
+        del anteriores[chunk_id]
+    anteriores.update(actuales) # Actualiza también la posición de los chunks sin cambios
+    manifest[VECTOR_STORE_BACKEND] = anteriores
+    guardar_manifest(manifest)
+
+    return {
+        "total": len(actuales),
+        "nuevos": len(nuevos) - modificados,
+        "modificados": modificados,
+        "eliminados": len(eliminados) - modificados,
+        "sin_cambios": len(actuales) - len(nuevos),
+    }
+
+
+def marcar_nueva_version_kb():
+    # Nueva versión de la base de conocimientos: invalida la caché semántica de respuestas del bot
+    with open(os.path.join(RAG_DIR, "kb_version.txt"), "w") as f:
+        f.write(str(time.time()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group()
+    origen.add_argument("--dir", default=DIR_POR_DEFECTO, help="Directorio con PDF, Markdown y TXT")
+    origen.add_argument("--pdf", help="Ingesta un único archivo")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--reset", action="store_true", help="Borra las filas existentes de lo ingestado y lo sube de nuevo")
+    args = parser.parse_args()
+
+    if args.pdf:
+        archivos = [args.pdf]
+        alcance = nombre_source(args.pdf)
+        en_alcance = lambda source: source == alcance
+    else:
+        archivos = listar_archivos(args.dir)
+        alcance = nombre_source(args.dir)
+        en_alcance = lambda source: source == alcance or source.startswith(alcance + os.sep) or alcance == "."
+
+    tiempos = {}
+    estadisticas = {"archivos": 0, "paginas": 0}
+
+    #---------- Paso 1 y 2: Carga + Chunking en paralelo, Paso 3 y 4: Embeddings + Vector Store ---------
+    # Misma caché de embeddings que usa el bot: los chunks que no cambiaron no se vuelven a embeber
+    embedding_model = CachedEmbeddings(OpenAIEmbeddings(model='text-embedding-ada-002'))
+    vector_store = crear_vector_store(embedding_model)
+
+    manifest = cargar_manifest()
+    es_local = isinstance(vector_store, LocalVectorStore)
+    if args.reset or VECTOR_STORE_BACKEND not in manifest:
+        # Sin manifiesto no sabemos qué filas son nuestras: las de ingestas anteriores se borran
+        limpiar_filas_previas(vector_store, manifest, en_alcance)
+    elif es_local:
+        reconciliar_manifest_local(manifest, vector_store)
+
+    inicio = time.perf_counter()
+    chunks = chunks_en_paralelo(archivos, args.procesos, estadisticas)
+    # Índice local: cada lote se anexa al archivo de vectores en lugar de reescribir la matriz entera
+    with vector_store.en_lote() if es_local else nullcontext():
+        resumen = sincronizar(chunks, vector_store, manifest, tiempos, en_alcance)
+    tiempos["total"] = time.perf_counter() - inicio
+    # La carga y el chunking se solapan con los embeddings: su tiempo es el total menos el resto
+    tiempos["carga_y_chunking"] = max(
+        0.0, tiempos["total"] - tiempos["embeddings_y_upsert"] - tiempos["diff"] - tiempos["borrado"]
+    )
+
+    if resumen["nuevos"] or resumen["modificados"] or resumen["eliminados"]:
+        marcar_nueva_version_kb()
+
+    print(f"\nIngesta ({VECTOR_STORE_BACKEND}) de {args.pdf or args.dir}")
+    print(
+        f"  {estadisticas['archivos']} archivos, {estadisticas['paginas']} páginas, "
+        f"{resumen['total']} chunks: {resumen['nuevos']} nuevos, {resumen['modificados']} modificados, "
+        f"{resumen['eliminados']} eliminados, {resumen['sin_cambios']} sin cambios"
+    )
+    for fase, segundos in tiempos.items():
+        print(f"  {fase:<20} {segundos:8.2f} s")
+    total = tiempos["total"] or 1e-9
+    print(f"  Throughput: {estadisticas['paginas'] / total:.1f} páginas/s, {resumen['total'] / total:.1f} chunks/s")
@@ -1,11 +1,13 @@
 from time import sleep
+import os
+import threading
 
 from langchain.agents import (
     AgentExecutor,
     create_tool_calling_agent
 )
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
 from langchain_core.tools import Tool
 from langchain_openai import ChatOpenAI
@@ -14,21 +16,36 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from tools_3_completo import DataPathTools
+from utils.contexto import historial_actual, resumen_actual, chat_id_actual
+from utils.user_profile import user_profiles
+from services.streaming import STREAM_REPLIES, TAG_AGENTE, TAG_RAG, excluir_del_streaming
+
+# La respuesta de consultar_DataPath se envía tal cual, sin que el agente la reescriba (una llamada al LLM menos)
+RAG_RETURN_DIRECT = os.getenv("RAG_RETURN_DIRECT", "1") == "1"
 
 
 class DataPath:
-    def __init__(self):
-        self.llm = ChatOpenAI(model= 'gpt-4o-mini') # no olvides adicionar tu api_key en el .env
+    def __init__(self, rag_return_direct=RAG_RETURN_DIRECT):
+        self.rag_return_direct = rag_return_direct
+        self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0, streaming=STREAM_REPLIES, stream_usage=True, tags=[TAG_AGENTE]) # no olvides adicionar tu api_key en el .env
         self.tool = DataPathTools()
-        self.history_messages = None  # Almacenamos el historial aquí
+
+        # El agente y el executor se construyen una sola vez y se comparten entre requests.
+        # El historial NO se guarda en la instancia: viaja en la ContextVar historial_actual.
+        self.agente, self.tools = self.crear_agente()
+        self.agent_executor = AgentExecutor.from_agent_and_tools(
+            agent=self.agente,
+            tools=self.tools,
+            verbose=True,
+        )
 
 
     def crear_agente(self):
 
-        # Creamos un closure para pasar el historial de mensajes a la herramienta consultar_DataPath
+        # El historial de la request en curso se lee del contexto, no de la instancia
         def consultar_DataPath_with_history(query: str) -> str:
             """Usa el sistema RAG para responder consultas sobre DataPath."""
-            return DataPathTools.consultar_DataPath(query, self.history_messages)
+            return DataPathTools.consultar_DataPath(query, historial_actual.get(), resumen_actual.get())
 
         tools = [
             Tool(name="bajar_video_youtube", func=DataPathTools.bajar_video_de_youtube, description="Descarga un video de YouTube y devuelve la ruta del archivo descargado para que sea usado por otra tool."),
@@ -38,11 +55,9 @@ class DataPath:
             Tool(name="guardar_nota", func=DataPathTools.guardar_nota, description="Guarda el texto en un archivo de texto dentro del directorio de notas y además devuelve ese texto o nota resumen al usuario."),
             DataPathTools.enviar_correo,  # Ya es un StructuredTool
             DataPathTools.registrar_google_sheet,  # Ya es un StructuredTool
-            Tool(name="consultar_DataPath",func=consultar_DataPath_with_history, description="Usa el sistema RAG para responder consultas sobre DataPath.")
+            Tool(name="consultar_DataPath",func=consultar_DataPath_with_history, description="Usa el sistema RAG para responder consultas sobre DataPath.", return_direct=self.rag_return_direct)
         ]
 
-        llm = ChatOpenAI(model='gpt-4o-mini', temperature=0)
-
         prompt = ChatPromptTemplate.from_messages(
             [
                 (
@@ -92,21 +107,18 @@ class DataPath:
 
 
         agent = create_tool_calling_agent(
-            llm=llm,
+            llm=self.llm,
             tools=tools,
             prompt=prompt,
         )
         return agent, tools
 
-    def procesar_mensaje(self, msg, agente, tools, history_messages=None):
-        
-        # Guardamos el historial de mensajes en la instancia
-        self.history_messages = history_messages
+    def procesar_mensaje(self, msg, history_messages=None, resumen=None):
 
         # Verificamos si history_messages llega correctamente
         if history_messages is None:
             print("No se recibió historial (history_messages es None)")
-            messages = []
+            history_messages = []
         else:
             print("Historial recibido desde app.py:")
             for idx, message in enumerate(history_messages):
@@ -116,22 +128,31 @@ class DataPath:
         # Se reconstruye la lista de mensajes para el prompt. 
         # Nota: Si antes usabas 'fromMe' y ahora usas 'isUser', asegúrate de que todos tus mensajes tengan la clave correcta.
         messages = []
-        for message in history_messages:
+        if resumen:
+            # Lo anterior a los mensajes recientes llega resumido (utils/conversation_memory.py)
+            messages.append(SystemMessage(content=f"Resumen de la conversación anterior:\n{resumen}"))
+        # Datos ya conocidos del usuario: el agente no necesita deducirlos del historial ni volver a pedirlos
+        perfil = user_profiles.get(chat_id_actual.get())
+        conocidos = {
+            "Nombre": perfil["nombre"],
+            "Correo": perfil["correo"],
+            "Programa de interés": perfil["programa_interes"],
+        }
+        conocidos = [f"- {campo}: {valor}" for campo, valor in conocidos.items() if valor]
+        if conocidos:
+            messages.append(SystemMessage(content="Datos del usuario ya registrados:\n" + "\n".join(conocidos)))
+        # get_chat_history devuelve los más nuevos primero; el agente los necesita en orden cronológico
+        for message in reversed(history_messages):
             # Usamos 'isUser' para determinar el tipo de mensaje
             message_class = HumanMessage if message.get('isUser') else AIMessage
             messages.append(message_class(content=message.get('body')))
-        messages.append(HumanMessage(content=msg))
 
         """Procesa el mensaje recibido vía WhatsApp y llama a la herramienta correcta."""
-        agent_executor = AgentExecutor.from_agent_and_tools(
-            agent=agente,
-            tools=tools,
-            verbose=True,
-        )
-
 
         # Prompt mejorado
         executor_prompt = {
+            # Resumen + mensajes recientes: el tamaño del historial no crece con la conversación
+            "chat_history": messages,
             "input": (
                 f"Analiza el siguiente mensaje y decide qué acción tomar:\n\n"
 
@@ -170,8 +191,32 @@ class DataPath:
             )
         }
 
-        
-        resultado = agent_executor.invoke(executor_prompt)
+
+        if not self.rag_return_direct:
+            # El agente reescribe la respuesta del RAG: al usuario solo le llega la versión final
+            excluir_del_streaming(TAG_RAG)
+
+        # Fijamos el historial solo para esta request; el executor compartido no guarda estado
+        token = historial_actual.set(history_messages)
+        token_resumen = resumen_actual.set(resumen)
+        try:
+            resultado = self.agent_executor.invoke(executor_prompt)
+        finally:
+            resumen_actual.reset(token_resumen)
+            historial_actual.reset(token)
+
+        return resultado
+
+
+_datapath = None
+_datapath_lock = threading.Lock()
 
 
-        return resultado
\ No newline at end of file
+def get_datapath():
+    """Devuelve la instancia compartida de DataPath, construyéndola la primera vez."""
+    global _datapath
+    if _datapath is None:
+        with _datapath_lock:
+            if _datapath is None:
+                _datapath = DataPath()
+    return _datapath
\ No newline at end of file
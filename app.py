@@ -1,72 +1,181 @@
 from flask import Flask, request, jsonify
 
-from bot.ai_bot import AIBot
+from bot.ai_bot import AIBot, get_ai_bot
+from bot.router import IntentRouter, PLANTILLAS
 from services.waha import Waha
+from services.chat_scheduler import ChatScheduler
+from services.dedup import WebhookDedup
+from services.media_jobs import MediaJobQueue, MEDIA_JOBS_ENABLED
+from services.streaming import RespuestaEnStreaming, STREAM_REPLIES, streaming_metrics
 
 import time
 
 import random
 
-from agent_3_completo import DataPath
+from agent_3_completo import get_datapath
 
 #Histórico del Chat
-from utils.db_utils import store_chat_history, get_chat_history
+from utils.db_utils import store_chat_history, get_chat_history, history_cache_metrics
+from utils.conversation_memory import conversation_memory
+from utils.user_profile import user_profiles
+from utils.contexto import chat_id_actual
 
 app = Flask(__name__)
 
 
-@app.route('/chatbot/webhook/', methods=['POST']) #Endpoint
-def webhook():
-    data = request.json
-
-    #Para no enviar mensaje de respuesta a los Grupos de Whatsapp que tengo -------------------------
-    chat_id = data['payload']['from']
-    received_message = data['payload']['body']
-
-    is_group = '@g.us' in chat_id
-    if is_group:
-        return jsonify({'status': 'success', 'message': 'Mensaje de grupo/status ignorada'}), 200
-    #------------------------------------------------------------------------------------------------
-
-    print(f'EVENTO RECIBIDO: {data}')
+def procesar_evento(evento):
+    """Pipeline completo de un mensaje (o ráfaga de mensajes) de un chat. Corre en un worker, fuera del hilo del webhook."""
+    inicio = time.perf_counter()
+    chat_id = evento['chat_id']
+    received_message = evento['body']
+    # Si el usuario mandó varios mensajes seguidos llegan juntos: se guardan por separado y se responden una vez
+    mensajes = evento.get('mensajes') or [received_message]
 
     waha = Waha()
     #ai_bot = AIBot() #Este es solo para probar el RAG, sólo el RAG
-    bot = DataPath()
-    agente, tools = bot.crear_agente()
 
     # Indica "escribiendo" en WhatsApp
     waha.start_typing(chat_id=chat_id)
 
-    # 1) Guardar mensaje de usuario en Supabase
-    store_chat_history(chat_id, "user", received_message)
+    # 1) Guardar mensajes de usuario en Supabase y actualizar su perfil con ellos
+    for mensaje in mensajes:
+        store_chat_history(chat_id, "user", mensaje)
+        user_profiles.actualizar(chat_id, "user", mensaje)
 
-    # 2) Obtener historial desde Supabase (últimos 10 mensajes)
-    historial = get_chat_history(chat_id=chat_id, limit=10)
+    # 2) Obtener historial: resumen de lo antiguo + mensajes recientes literales
+    historial = get_chat_history(chat_id=chat_id, limit=conversation_memory.ventana)
+    resumen, historial = conversation_memory.preparar(chat_id, historial)
     print("Historial recuperado:", historial)
 
-    #--------------------------------- 3) Test del RAG como Tool del Agente------------------------------
+    #---------------------- 3) Router: plantilla, RAG directo, cola multimedia o agente ----------------------
+    # Con streaming, cada oración de la respuesta final se envía apenas el LLM la termina
+    respuesta = RespuestaEnStreaming(waha, chat_id, inicio=inicio)
+
+    # El motor RAG lee el perfil del chat en curso desde el contexto
+    token = chat_id_actual.set(chat_id)
+    ruta = None
     try:
-        resultado = bot.procesar_mensaje(received_message, agente, tools, history_messages=historial)
-        response_message = resultado.get("output", "No se pudo procesar el mensaje correctamente.")
+        # Saludos y despedidas salen de plantillas, las FAQ van directo al RAG, los videos a su cola y el resto al agente
+        if STREAM_REPLIES:
+            with respuesta.activa():
+                response_message, ruta = router.procesar(received_message, historial, resumen)
+        else:
+            response_message, ruta = router.procesar(received_message, historial, resumen)
     except Exception as e:
         print(f"Error al procesar el mensaje: {e}")
         response_message = f"Ocurrió un error al procesar tu mensaje: {str(e)}"
+    finally:
+        chat_id_actual.reset(token)
+
+    # 4) Enviar respuesta al usuario por WhatsApp (lo que no salió ya en streaming)
+    enviado = respuesta.terminar(response_message)
+    waha.stop_typing(chat_id=chat_id)
     #--------------------------------------------------------------------------------------------------
 
-    # 4) Guardar mensaje del bot en Supabase
-    store_chat_history(chat_id, "bot", response_message)
+    # 5) Guardar mensaje del bot en Supabase (la cola multimedia guarda su propio acuse)
+    # Se guarda lo que recibió el usuario, que tras un stream cortado no es response_message.
+    # Las plantillas del router no dicen nada del usuario: no pasan por su perfil
+    if enviado:
+        _guardar_respuesta_bot(chat_id, enviado, actualizar_perfil=ruta not in PLANTILLAS)
 
-    # 5) Enviar respuesta al usuario por WhatsApp
-    waha.send_message(
-        chat_id=chat_id,
-        message=response_message,
-    )
 
-    waha.stop_typing(chat_id=chat_id)
+def _responder_con_agente(mensaje, historial, resumen):
+    resultado = get_datapath().procesar_mensaje(mensaje, history_messages=historial, resumen=resumen)
+    return resultado.get("output", "No se pudo procesar el mensaje correctamente.")
+
+
+def _responder_con_rag(mensaje, historial, resumen):
+    return get_ai_bot().invoke(historial, mensaje, resumen=resumen)
+
+
+def _guardar_respuesta_bot(chat_id, mensaje, actualizar_perfil=True):
+    store_chat_history(chat_id, "bot", mensaje)
+    if actualizar_perfil:
+        user_profiles.actualizar(chat_id, "bot", mensaje)
+
+
+# YouTube -> audio -> transcripción -> nota corre en su propia cola, con avisos de progreso por WAHA
+media_jobs = MediaJobQueue(
+    enviar=lambda chat_id, texto: Waha().send_message(chat_id=chat_id, message=texto),
+    # Acuses y notas no son respuestas al usuario: no aportan datos a su perfil
+    guardar=lambda chat_id, texto: _guardar_respuesta_bot(chat_id, texto, actualizar_perfil=False),
+)
+
+
+def _encolar_multimedia(mensaje, historial, resumen):
+    return media_jobs.encolar(chat_id_actual.get(), mensaje)
+
+
+router = IntentRouter(
+    agente=_responder_con_agente,
+    rag=_responder_con_rag,
+    multimedia=_encolar_multimedia if MEDIA_JOBS_ENABLED else None,
+)
+
+# El scheduler agrupa las ráfagas de cada chat y las procesa en orden; los workers procesan
+# los eventos en segundo plano (tamaño configurable con WEBHOOK_WORKERS)
+scheduler = ChatScheduler(handler=procesar_evento)
+worker_pool = scheduler.worker_pool
+
+# Reintentos de WAHA, mensajes propios y eventos que no son mensajes se descartan en el webhook
+dedup = WebhookDedup()
+
+# Construimos el agente y el motor RAG al arrancar para que el primer mensaje no pague ese costo
+get_datapath()
+get_ai_bot()
+
+
+@app.route('/chatbot/webhook/', methods=['POST']) #Endpoint
+def webhook():
+    data = request.get_json(silent=True) or {}
+
+    #Antes que nada: duplicados por reintento de WAHA, mensajes enviados por el bot y otros eventos
+    procesar, motivo = dedup.filtrar(data)
+    if not procesar:
+        return jsonify({'status': 'success', 'message': motivo}), 200
+
+    #Validamos que el evento tenga la estructura esperada antes de encolarlo -------------------------
+    payload = data.get('payload') or {}
+    chat_id = payload.get('from')
+    received_message = payload.get('body')
+
+    if not chat_id or not received_message:
+        return jsonify({'status': 'success', 'message': 'Evento sin mensaje ignorado'}), 200
+
+    #Para no enviar mensaje de respuesta a los Grupos de Whatsapp que tengo -------------------------
+    is_group = '@g.us' in chat_id
+    if is_group:
+        return jsonify({'status': 'success', 'message': 'Mensaje de grupo/status ignorada'}), 200
+    #------------------------------------------------------------------------------------------------
+
+    print(f'EVENTO RECIBIDO: {data}')
 
-    return jsonify({'status': 'success'}), 200
+    # Encolamos y respondemos a WAHA de inmediato; el agente corre en un worker
+    encolado = scheduler.submit({'chat_id': chat_id, 'body': received_message})
+    if not encolado:
+        # Que el reintento de WAHA pueda entrar cuando haya lugar
+        dedup.liberar(data)
+        return jsonify({'status': 'error', 'message': 'Cola de eventos llena'}), 503
+
+    return jsonify({'status': 'success', 'message': 'Evento encolado'}), 200
+
+
+@app.route('/chatbot/metrics/', methods=['GET'])
+def metrics():
+    return jsonify({
+        'workers': worker_pool.metrics(),
+        'scheduler': scheduler.metrics(),
+        'dedup': dedup.metrics(),
+        'media_jobs': media_jobs.metrics(),
+        'history_cache': history_cache_metrics(),
+        'semantic_cache': get_ai_bot().semantic_cache_metrics(),
+        'embedding_cache': get_ai_bot().embedding_cache_metrics(),
+        'conversation_memory': conversation_memory.metrics(),
+        'user_profiles': user_profiles.metrics(),
+        'router': router.metrics(),
+        'streaming': streaming_metrics(),
+    }), 200
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5005, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5005, debug=True)
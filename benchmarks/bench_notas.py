@@ -0,0 +1,35 @@
+"""
+Compara los modos de generación de notas (secuencial, concurrente, estructurado)
+sobre una misma transcripción: tiempo total y tokens de entrada/salida.
+
+Hace llamadas reales a OpenAI, así que cada modo consume tokens.
+
+Uso (desde la raíz del repo, con el .env configurado):
+    python -m benchmarks.bench_notas _transcripciones_extraídos_descargados/mi_video.md
+"""
+import argparse
+import time
+
+from utils.crea_partes_notas import Notes
+
+MODOS = ('secuencial', 'concurrente', 'estructurado')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcripcion_path')
+    parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+    args = parser.parse_args()
+
+    with open(args.transcripcion_path, 'r', encoding='utf-8', errors='replace') as f:
+        texto = f.read()
+
+    resultados = []
+    for modo in args.modos:
+        inicio = time.perf_counter()
+        _, uso = Notes.crea_secciones(texto, modo=modo)
+        resultados.append((modo, time.perf_counter() - inicio, uso))
+
+    print(f"\n{'modo':<14}{'tiempo (s)':>12}{'tokens entrada':>16}{'tokens salida':>15}")
+    for modo, segundos, uso in resultados:
+        print(f"{modo:<14}{segundos:>12.2f}{uso['input_tokens']:>16}{uso['output_tokens']:>15}")
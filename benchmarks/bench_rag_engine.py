@@ -0,0 +1,81 @@
+"""
+Micro-benchmark del costo fijo por llamada de consultar_DataPath.
+
+Antes: cada llamada construía un AIBot nuevo (ChatOpenAI, OpenAIEmbeddings, cliente de
+Supabase y SupabaseVectorStore) y además el ChatPromptTemplate y la stuff-documents chain.
+Después: se reutiliza el motor compartido de get_ai_bot().
+
+La búsqueda en el vector store y la llamada al LLM son iguales en ambos casos, así que
+no se ejecutan: aquí solo se mide la construcción que se ahorra por llamada.
+"Antes" reproduce esa construcción tal como era (sin la caché de embeddings ni el corpus
+del retriever híbrido que hoy carga AIBot()), así que no hace llamadas de red.
+
+Uso (desde la raíz del repo, con el .env configurado):
+    python -m benchmarks.bench_rag_engine --iteraciones 50
+"""
+import argparse
+import statistics
+import os
+import time
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_community.vectorstores import SupabaseVectorStore
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from supabase import create_client
+
+from bot.ai_bot import SYSTEM_TEMPLATE, get_ai_bot
+
+
+def por_llamada_antes():
+    # Lo que hacía AIBot() en cada llamada antes de compartir el motor
+    chat = ChatOpenAI(model='gpt-4o-mini')
+    client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_SERVICE_KEY"))
+    vector_store = SupabaseVectorStore(
+        client=client,
+        embedding=OpenAIEmbeddings(model='text-embedding-ada-002'),
+        table_name="documents",
+        query_name="match_documents",
+    )
+    vector_store.as_retriever(search_kwargs={'k': 15})
+    prompt = ChatPromptTemplate.from_messages(
+        [('system', SYSTEM_TEMPLATE), MessagesPlaceholder(variable_name='messages')]
+    )
+    create_stuff_documents_chain(chat, prompt)
+
+
+def por_llamada_despues():
+    get_ai_bot()
+
+
+def medir(func, iteraciones):
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        func()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def resumen(nombre, tiempos):
+    print(
+        f"{nombre:<10} media={statistics.mean(tiempos):9.3f} ms  "
+        f"mediana={statistics.median(tiempos):9.3f} ms  max={max(tiempos):9.3f} ms"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iteraciones', type=int, default=20)
+    args = parser.parse_args()
+
+    # Calentamos el motor compartido fuera de la medición, como ocurre al arrancar la app
+    get_ai_bot()
+
+    antes = medir(por_llamada_antes, args.iteraciones)
+    despues = medir(por_llamada_despues, args.iteraciones)
+
+    print(f"Costo fijo por llamada de consultar_DataPath ({args.iteraciones} iteraciones)")
+    resumen("antes", antes)
+    resumen("después", despues)
+    print(f"Ahorro medio por llamada: {statistics.mean(antes) - statistics.mean(despues):.3f} ms")
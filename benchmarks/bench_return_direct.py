@@ -0,0 +1,99 @@
+"""
+Compara el camino de tres llamadas del agente con el modo return_direct de consultar_DataPath.
+
+Antes: el agente llama al LLM para elegir consultar_DataPath, AIBot.invoke hace una segunda
+llamada para redactar la respuesta y el agente hace una tercera que casi la repite.
+Después (RAG_RETURN_DIRECT=1): la respuesta de la tool se envía tal cual, sin la tercera llamada.
+
+Hace llamadas reales a OpenAI. La caché semántica se desactiva para que ambos modos
+paguen la consulta completa. Los resultados se guardan en un JSON para poder comparar corridas.
+
+Uso (desde la raíz del repo, con el .env configurado):
+    python -m benchmarks.bench_return_direct --repeticiones 3
+    python -m benchmarks.bench_return_direct --salida benchmarks/resultados/return_direct.json
+"""
+import os
+
+# Antes de importar el motor RAG: con caché el segundo modo respondería sin llamar al LLM
+os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from langchain_community.callbacks.manager import get_openai_callback
+
+from agent_3_completo import DataPath
+
+PREGUNTAS = (
+    "¿Qué programas en vivo tiene DataPath?",
+    "¿Cuánto dura el Data Engineer Program?",
+    "¿Quiénes son los docentes de DataPath?",
+    "¿Tienen cursos grabados de SQL?",
+    "¿Cómo es la metodología de enseñanza?",
+)
+
+SALIDA_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados", "return_direct.json")
+
+
+def medir(modo, agente, preguntas, repeticiones):
+    corridas = []
+    for _ in range(repeticiones):
+        for pregunta in preguntas:
+            with get_openai_callback() as cb:
+                inicio = time.perf_counter()
+                resultado = agente.procesar_mensaje(pregunta, history_messages=[])
+                segundos = time.perf_counter() - inicio
+            corridas.append({
+                "pregunta": pregunta,
+                "segundos": segundos,
+                "llamadas_llm": cb.successful_requests,
+                "tokens_entrada": cb.prompt_tokens,
+                "tokens_salida": cb.completion_tokens,
+                "costo_usd": cb.total_cost,
+                "respuesta": resultado.get("output"),
+            })
+    return {
+        "modo": modo,
+        "resumen": {
+            "latencia_media": statistics.mean(c["segundos"] for c in corridas),
+            "latencia_mediana": statistics.median(c["segundos"] for c in corridas),
+            "llamadas_llm_media": statistics.mean(c["llamadas_llm"] for c in corridas),
+            "tokens_entrada_media": statistics.mean(c["tokens_entrada"] for c in corridas),
+            "tokens_salida_media": statistics.mean(c["tokens_salida"] for c in corridas),
+            "costo_usd_total": sum(c["costo_usd"] for c in corridas),
+        },
+        "corridas": corridas,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--salida', default=SALIDA_POR_DEFECTO)
+    args = parser.parse_args()
+
+    resultados = [
+        medir("tres_llamadas", DataPath(rag_return_direct=False), PREGUNTAS, args.repeticiones),
+        medir("return_direct", DataPath(rag_return_direct=True), PREGUNTAS, args.repeticiones),
+    ]
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(
+            {"fecha": datetime.now(timezone.utc).isoformat(), "repeticiones": args.repeticiones, "resultados": resultados},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    print(f"\n{'modo':<15}{'latencia (s)':>14}{'llamadas LLM':>14}{'tokens entrada':>16}{'tokens salida':>15}")
+    for r in resultados:
+        s = r["resumen"]
+        print(
+            f"{r['modo']:<15}{s['latencia_media']:>14.2f}{s['llamadas_llm_media']:>14.1f}"
+            f"{s['tokens_entrada_media']:>16.0f}{s['tokens_salida_media']:>15.0f}"
+        )
+    print(f"Resultados guardados en {args.salida}")
@@ -0,0 +1,130 @@
+"""
+Hit rate de la caché semántica en conversaciones de varios turnos.
+
+Cada conversación simula un chat real: saludo (respondido con la plantilla del router, que
+queda en el historial como mensaje del bot), preguntas frecuentes parafraseadas entre chats
+y seguimientos que solo se entienden con el contexto ("¿y cuánto cuesta?").
+
+Se comparan dos reglas para decidir si una pregunta usa la caché:
+  - historial: solo sin conversación previa (ningún mensaje del bot ni resumen)
+  - pregunta: pregunta_autonoma(), que mira solo la pregunta
+
+Métricas por regla:
+  - hit rate sobre las preguntas autónomas (lo que la caché puede ahorrar)
+  - hits falsos: seguimientos que recibieron una respuesta cacheada de otro chat (debe ser 0)
+
+Las respuestas no se generan: cada pregunta autónoma guarda como respuesta su "tema" y un
+hit cuenta como correcto si devuelve el mismo tema. Hace llamadas reales a la API de
+embeddings (con la caché de embeddings, las corridas siguientes son gratis).
+
+Uso (desde la raíz del repo, con el .env configurado):
+    python -m benchmarks.bench_semantic_cache
+    python -m benchmarks.bench_semantic_cache --umbral 0.93
+"""
+import argparse
+
+from langchain_openai import OpenAIEmbeddings
+
+from bot.embedding_cache import CachedEmbeddings
+from bot.semantic_cache import SemanticCache, SEMANTIC_CACHE_THRESHOLD, pregunta_autonoma
+
+# (pregunta, tema) para las autónomas; tema None para los seguimientos que dependen del contexto
+CONVERSACIONES = (
+    (
+        ("¿Qué programas en vivo tiene DataPath?", "programas"),
+        ("¿y cuánto cuesta?", None),
+        ("¿Cuánto dura el Data Engineer Program?", "duracion_de"),
+    ),
+    (
+        ("¿Qué programas en vivo ofrece DataPath?", "programas"),
+        ("¿ese es online?", None),
+        ("¿Quiénes son los docentes de DataPath?", "docentes"),
+    ),
+    (
+        ("¿Cuánto tiempo dura el Data Engineer Program?", "duracion_de"),
+        ("¿y el de AI Engineer?", None),
+        ("¿Cómo es la metodología de enseñanza de DataPath?", "metodologia"),
+    ),
+    (
+        ("¿Quiénes son los profesores de DataPath?", "docentes"),
+        ("¿precio?", None),
+        ("¿Qué programas en vivo tienen en DataPath?", "programas"),
+        ("¿eso incluye certificado?", None),
+    ),
+    (
+        ("¿Cuál es la metodología de enseñanza de DataPath?", "metodologia"),
+        ("¿Tienen cursos grabados de SQL?", "grabados_sql"),
+        ("¿y cuándo empieza?", None),
+    ),
+)
+
+SALUDO = {"isUser": False, "body": "¡Hola! 👋 Soy DataBot, el asistente de DataPath. ¿Qué te gustaría saber?"}
+
+
+def usa_cache_por_historial(pregunta, historial):
+    return not any(not m.get("isUser", False) for m in historial)
+
+
+def usa_cache_por_pregunta(pregunta, historial):
+    return pregunta_autonoma(pregunta)
+
+
+def simular(nombre, usa_cache, embeddings, umbral):
+    cache = SemanticCache(embeddings, threshold=umbral)
+    autonomas = hits = hits_falsos = hits_incorrectos = 0
+    for conversacion in CONVERSACIONES:
+        # El chat empieza con "hola" y la plantilla del router ya está en el historial
+        historial = [{"isUser": True, "body": "hola"}, SALUDO]
+        for pregunta, tema in conversacion:
+            autonomas += tema is not None
+            if usa_cache(pregunta, historial):
+                respuesta, vector = cache.lookup(pregunta)
+                if respuesta is None:
+                    cache.store(vector, tema)
+                elif tema is None:
+                    hits_falsos += 1
+                elif respuesta == tema:
+                    hits += 1
+                else:
+                    hits_incorrectos += 1
+            historial += [{"isUser": True, "body": pregunta}, {"isUser": False, "body": f"(respuesta: {tema})"}]
+    return {
+        "regla": nombre,
+        "hit_rate": hits / autonomas if autonomas else 0.0,
+        "hits": hits,
+        "hits_incorrectos": hits_incorrectos,
+        "hits_falsos": hits_falsos,
+    }
+
+
+def clasificacion():
+    errores = [
+        (pregunta, tema is not None)
+        for conversacion in CONVERSACIONES
+        for pregunta, tema in conversacion
+        if pregunta_autonoma(pregunta) != (tema is not None)
+    ]
+    for pregunta, esperado in errores:
+        print(f"  pregunta_autonoma falló: {pregunta!r} (esperado {esperado})")
+    return errores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--umbral', type=float, default=SEMANTIC_CACHE_THRESHOLD)
+    args = parser.parse_args()
+
+    errores = clasificacion()
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model='text-embedding-ada-002'))
+
+    print(f"Caché semántica en {len(CONVERSACIONES)} conversaciones (umbral {args.umbral})")
+    for resultado in (
+        simular("historial", usa_cache_por_historial, embeddings, args.umbral),
+        simular("pregunta", usa_cache_por_pregunta, embeddings, args.umbral),
+    ):
+        print(
+            f"{resultado['regla']:<10} hit_rate={resultado['hit_rate']:.2f}  hits={resultado['hits']}  "
+            f"incorrectos={resultado['hits_incorrectos']}  falsos={resultado['hits_falsos']}"
+        )
+    if errores:
+        raise SystemExit(f"pregunta_autonoma clasificó mal {len(errores)} preguntas")
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "embeddings.sqlite"),
+)
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "5000"))
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_texto(texto):
+    return _ESPACIOS.sub(" ", unicodedata.normalize("NFKC", texto)).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """Envuelve un modelo de embeddings con una caché en memoria (LRU) respaldada en disco.
+
+    La clave es el modelo + el texto normalizado. En disco se usa SQLite y cada vector
+    se guarda como float32 binario (no como lista JSON). El disco se acota por número de
+    filas expulsando las menos usadas.
+    """
+
+    def __init__(self, underlying, path=EMBEDDING_CACHE_PATH, max_rows=EMBEDDING_CACHE_MAX_ROWS,
+                 memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.__underlying = underlying
+        self.__model = getattr(underlying, "model", type(underlying).__name__)
+        self.__max_rows = max_rows
+        self.__memory_entries = memory_entries
+        self.__memory = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.__db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self.__db.commit()
+
+    def __key(self, texto):
+        return hashlib.sha256(f"{self.__model}\0{normalizar_texto(texto)}".encode("utf-8")).hexdigest()
+
+    def __remember(self, key, vector):
+        self.__memory[key] = vector
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.__memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __lookup(self, keys):
+        """Devuelve {key: vector} con lo que haya en memoria o en disco."""
+        encontrados = {}
+        with self.__lock:
+            faltan = []
+            for key in keys:
+                vector = self.__memory.get(key)
+                if vector is not None:
+                    self.__memory.move_to_end(key)
+                    encontrados[key] = vector
+                else:
+                    faltan.append(key)
+
+            if faltan:
+                ahora = time.time()
+                for i in range(0, len(faltan), 500):
+                    lote = faltan[i:i + 500]
+                    filas = self.__db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(lote))})", lote
+                    ).fetchall()
+                    for key, blob in filas:
+                        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                        encontrados[key] = vector
+                        self.__remember(key, vector)
+                    self.__db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(ahora, key) for key, _ in filas]
+                    )
+                self.__db.commit()
+        return encontrados
+
+    def __store(self, nuevos):
+        ahora = time.time()
+        with self.__lock:
+            for key, vector in nuevos.items():
+                self.__remember(key, vector)
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), ahora) for key, vector in nuevos.items()],
+            )
+            total = self.__db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if total > self.__max_rows:
+                self.__db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (total - self.__max_rows,),
+                )
+            self.__db.commit()
+
+    def embed_documents(self, texts):
+        keys = [self.__key(texto) for texto in texts]
+        encontrados = self.__lookup(set(keys))
+
+        # Los que faltan se piden al modelo en una sola llamada (el modelo ya los agrupa en lotes)
+        faltan = {}
+        for key, texto in zip(keys, texts):
+            if key not in encontrados and key not in faltan:
+                faltan[key] = texto
+        if faltan:
+            vectores = self.__underlying.embed_documents(list(faltan.values()))
+            nuevos = dict(zip(faltan.keys(), vectores))
+            self.__store(nuevos)
+            encontrados.update(nuevos)
+
+        with self.__lock:
+            self.__misses += len(faltan)
+            self.__hits += len(texts) - len(faltan)
+        return [encontrados[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self.__key(text)
+        vector = self.__lookup([key]).get(key)
+        if vector is None:
+            vector = self.__underlying.embed_query(text)
+            self.__store({key: vector})
+            with self.__lock:
+                self.__misses += 1
+        else:
+            with self.__lock:
+                self.__hits += 1
+        return vector
+
+    def metrics(self):
+        with self.__lock:
+            total = self.__hits + self.__misses
+            return {
+                "memory_entries": len(self.__memory),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / total if total else 0.0,
+            }
@@ -0,0 +1,246 @@
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from bot.semantic_cache import leer_version_kb
+
+
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "hybrid")  # "hybrid" o "vector"
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))  # peso del vector frente a BM25
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "15"))  # candidatos de cada lado
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))  # presupuesto de contexto
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+# Si no se pudo leer el corpus (Supabase caído), cada cuánto se reintenta
+HYBRID_CORPUS_RETRY_SECONDS = float(os.getenv("HYBRID_CORPUS_RETRY_SECONDS", "60"))
+_KB_VERSION_CHECK_INTERVAL = 5.0
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a al con de del el en es la las lo los o para por que se su sus un una y e u mi me te tu "
+    "como cual cuales cuanto cuando donde esta este esto hay mas muy sobre son ser".split()
+)
+
+
+def tokenizar(texto):
+    """Minúsculas, sin tildes y sin stopwords: 'Qué cursos' y 'que CURSOS' dan los mismos términos."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _PALABRA.findall(texto) if t not in _STOPWORDS]
+
+
+def _crear_contador_tokens():
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda texto: len(encoding.encode(texto))
+    except ImportError:
+        return lambda texto: len(texto) // 4
+
+
+contar_tokens = _crear_contador_tokens()
+
+
+class BM25Index:
+    """Índice BM25 en memoria sobre los chunks de la base de conocimientos."""
+
+    def __init__(self, textos, k1=1.5, b=0.75):
+        self.__k1 = k1
+        self.__b = b
+        self.__frecuencias = [Counter(tokenizar(texto)) for texto in textos]
+        self.__longitudes = [sum(f.values()) for f in self.__frecuencias]
+        self.__longitud_media = (sum(self.__longitudes) / len(self.__longitudes)) if textos else 0.0
+
+        documentos_por_termino = Counter()
+        for frecuencia in self.__frecuencias:
+            documentos_por_termino.update(frecuencia.keys())
+        n = len(textos)
+        self.__idf = {
+            termino: math.log(1 + (n - df + 0.5) / (df + 0.5)) for termino, df in documentos_por_termino.items()
+        }
+
+    def buscar(self, consulta, k):
+        """Devuelve [(índice, score)] de los k mejores chunks."""
+        terminos = [t for t in set(tokenizar(consulta)) if t in self.__idf]
+        if not terminos:
+            return []
+        scores = []
+        for i, frecuencia in enumerate(self.__frecuencias):
+            score = 0.0
+            normalizacion = self.__k1 * (1 - self.__b + self.__b * self.__longitudes[i] / (self.__longitud_media or 1))
+            for termino in terminos:
+                tf = frecuencia.get(termino)
+                if tf:
+                    score += self.__idf[termino] * tf * (self.__k1 + 1) / (tf + normalizacion)
+            if score > 0:
+                scores.append((i, score))
+        scores.sort(key=lambda par: par[1], reverse=True)
+        return scores[:k]
+
+
+def cargar_corpus_supabase(client, page_size=1000):
+    """Lee todos los chunks de la tabla documents para construir el índice BM25."""
+    textos, metadatos = [], []
+    inicio = 0
+    while True:
+        response = (
+            client.table("documents")
+            .select("content, metadata")
+            .range(inicio, inicio + page_size - 1)
+            .execute()
+        )
+        filas = response.data or []
+        for fila in filas:
+            textos.append(fila["content"])
+            metadatos.append(fila.get("metadata") or {})
+        if len(filas) < page_size:
+            return textos, metadatos
+        inicio += page_size
+
+
+def _normalizar_scores(scores):
+    if not scores:
+        return {}
+    minimo, maximo = min(scores.values()), max(scores.values())
+    if maximo == minimo:
+        return {clave: 1.0 for clave in scores}
+    return {clave: (valor - minimo) / (maximo - minimo) for clave, valor in scores.items()}
+
+
+def _shingles(texto, n=5):
+    palabras = tokenizar(texto)
+    return {tuple(palabras[i:i + n]) for i in range(max(1, len(palabras) - n + 1))}
+
+
+class HybridRetriever:
+    """Retriever híbrido: BM25 local + búsqueda vectorial, con deduplicación y presupuesto de tokens.
+
+    Los scores de ambos lados se normalizan (min-max) y se combinan con HYBRID_ALPHA.
+    Los chunks casi duplicados (mucho solapamiento de 5-gramas) se descartan y el resto
+    se empaqueta, de mejor a peor, hasta RAG_CONTEXT_TOKENS.
+
+    El corpus para BM25 se carga en un hilo aparte (al crear el retriever y cuando cambia
+    kb_version.txt): construirlo nunca frena el arranque ni una consulta. Mientras no hay
+    índice, o si la carga falla, se responde solo con la búsqueda vectorial.
+    """
+
+    def __init__(self, vector_store, cargar_corpus, alpha=HYBRID_ALPHA, candidatos=HYBRID_CANDIDATES,
+                 token_budget=RAG_CONTEXT_TOKENS, dedup_threshold=DEDUP_THRESHOLD):
+        self.__vector_store = vector_store
+        self.__cargar_corpus = cargar_corpus
+        self.__alpha = alpha
+        self.__candidatos = candidatos
+        self.__token_budget = token_budget
+        self.__dedup_threshold = dedup_threshold
+        self.__lock = threading.Lock()
+        self.__kb_version = None
+        self.__proxima_revision = 0.0
+        self.__cargando = False
+        self.__listo = threading.Event()  # se marca tras el primer intento de carga, salga bien o mal
+        self.__indice = None  # (textos, metadatos, BM25Index)
+        self.__recargar_si_cambio()
+
+    def __recargar_si_cambio(self):
+        ahora = time.monotonic()
+        with self.__lock:
+            if self.__cargando or ahora < self.__proxima_revision:
+                return
+            self.__proxima_revision = ahora + _KB_VERSION_CHECK_INTERVAL
+            version = leer_version_kb()
+            if self.__indice is not None and version == self.__kb_version:
+                return
+            self.__cargando = True
+        threading.Thread(target=self.__cargar, args=(version,), name="bm25-loader", daemon=True).start()
+
+    def __cargar(self, version):
+        try:
+            textos, metadatos = self.__cargar_corpus()
+            indice = (textos, metadatos, BM25Index(textos))
+        except Exception as e:
+            print(f"No se pudo cargar el corpus para BM25, se usa solo la búsqueda vectorial: {e}")
+            with self.__lock:
+                self.__cargando = False
+                self.__proxima_revision = time.monotonic() + HYBRID_CORPUS_RETRY_SECONDS
+            self.__listo.set()
+            return
+        with self.__lock:
+            self.__indice = indice
+            self.__kb_version = version
+            self.__cargando = False
+        self.__listo.set()
+        print(f"Índice BM25 construido con {len(textos)} chunks")
+
+    def esperar_indice(self, timeout=None):
+        """Espera el primer intento de carga del corpus. Devuelve True si hay índice BM25."""
+        self.__listo.wait(timeout)
+        return self.__indice is not None
+
+    def __busqueda_vectorial(self, consulta, embedding):
+        if embedding is not None:
+            # El embedding ya se calculó (caché semántica): no se vuelve a pedir
+            return self.__vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=self.__candidatos)
+        return self.__vector_store.similarity_search_with_relevance_scores(consulta, k=self.__candidatos)
+
+    def __candidatos_fusionados(self, consulta, embedding=None):
+        indice = self.__indice
+
+        # El texto del chunk es la clave común entre ambos lados
+        documentos = {}
+        vector_scores = {}
+        for documento, score in self.__busqueda_vectorial(consulta, embedding):
+            documentos.setdefault(documento.page_content, documento)
+            vector_scores[documento.page_content] = max(score, vector_scores.get(documento.page_content, score))
+
+        bm25_scores = {}
+        if indice is not None:
+            textos, metadatos, bm25 = indice
+            for i, score in bm25.buscar(consulta, self.__candidatos):
+                documentos.setdefault(textos[i], Document(page_content=textos[i], metadata=metadatos[i]))
+                bm25_scores[textos[i]] = max(score, bm25_scores.get(textos[i], score))
+
+        # Sin índice BM25 (todavía cargando o falló la carga) manda solo el vector
+        alpha = self.__alpha if indice is not None else 1.0
+        vector_scores = _normalizar_scores(vector_scores)
+        bm25_scores = _normalizar_scores(bm25_scores)
+        fusionados = {
+            texto: alpha * vector_scores.get(texto, 0.0) + (1 - alpha) * bm25_scores.get(texto, 0.0)
+            for texto in documentos
+        }
+        orden = sorted(fusionados, key=fusionados.get, reverse=True)
+        return [(documentos[texto], fusionados[texto]) for texto in orden]
+
+    def __empaquetar(self, candidatos):
+        seleccionados = []
+        vistos = []
+        usados = 0
+        for documento, score in candidatos:
+            shingles = _shingles(documento.page_content)
+            # Contención: si casi todo el chunk ya está en uno elegido, es redundante
+            duplicado = any(
+                len(shingles & otro) / (min(len(shingles), len(otro)) or 1) >= self.__dedup_threshold
+                for otro in vistos
+            )
+            if duplicado:
+                continue
+            tokens = contar_tokens(documento.page_content)
+            if seleccionados and usados + tokens > self.__token_budget:
+                continue  # Puede que un chunk más corto todavía entre
+            documento.metadata = {**documento.metadata, "score_hibrido": round(score, 4)}
+            seleccionados.append(documento)
+            vistos.append(shingles)
+            usados += tokens
+        return seleccionados
+
+    def invoke(self, consulta, *args, embedding=None, **kwargs):
+        self.__recargar_si_cambio()
+        documentos = self.__empaquetar(self.__candidatos_fusionados(consulta, embedding))
+        print(f"Retriever híbrido: {len(documentos)} chunks seleccionados para el contexto")
+        return documentos
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+# "supabase" (por defecto) o "local"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "supabase")
+
+LOCAL_VECTOR_STORE_DIR = os.getenv(
+    "LOCAL_VECTOR_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RAG", "vector_index"),
+)
+
+_VECTORES = "vectors.f32"
+_META = "meta.json"
+# Cada cuánto se mira si otro proceso (RAG/rag.py) reescribió el índice
+_REVISION_INTERVAL = 5.0
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store local en proceso, alternativa a SupabaseVectorStore.
+
+    Los embeddings (normalizados) viven en una matriz float32 contigua persistida como
+    archivo binario y abierta con np.memmap; los textos y metadatos en un JSON al lado.
+    La búsqueda es un producto matriz-vector (similitud coseno) + argpartition para el top-k.
+    Si otro proceso re-ingesta el índice, el snapshot se recarga al detectar el cambio de
+    meta.json (se reemplaza el último, así el par de archivos ya está completo).
+
+    Dentro de en_lote() (ingesta), los ids nuevos se anexan al final del archivo de vectores
+    y meta.json se escribe una sola vez al salir: cada lote cuesta solo sus propias filas.
+    """
+
+    def __init__(self, embedding, persist_dir=LOCAL_VECTOR_STORE_DIR):
+        self.__embedding = embedding
+        self.__persist_dir = persist_dir
+        self.__lock = threading.Lock()
+        # (ids, textos, metadatos, matriz); se reemplaza entero en cada escritura
+        self.__snapshot = ([], [], [], None)
+        self.__firma = None  # mtime de meta.json del snapshot cargado
+        self.__proxima_revision = 0.0
+        self.__ids_lote = None  # set de ids mientras dura en_lote(); None fuera de él
+        self.__meta_pendiente = False
+        self.__cargar()
+
+    @property
+    def embeddings(self):
+        return self.__embedding
+
+    @property
+    def __ids(self):
+        return self.__snapshot[0]
+
+    @property
+    def __textos(self):
+        return self.__snapshot[1]
+
+    @property
+    def __metadatos(self):
+        return self.__snapshot[2]
+
+    @property
+    def __matriz(self):
+        return self.__snapshot[3]
+
+    #--------------------------------------- Persistencia -----------------------------------------
+    def __firma_en_disco(self):
+        try:
+            return os.stat(os.path.join(self.__persist_dir, _META)).st_mtime_ns
+        except OSError:
+            return None
+
+    def __recargar_si_cambio(self, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora < self.__proxima_revision:
+            return
+        self.__proxima_revision = ahora + _REVISION_INTERVAL
+        if self.__firma_en_disco() == self.__firma:
+            return
+        with self.__lock:
+            if self.__firma_en_disco() == self.__firma:
+                return
+            try:
+                self.__cargar()
+            except (OSError, ValueError, KeyError) as e:
+                # Escritura en curso: se reintenta en la próxima revisión con el snapshot anterior
+                print(f"No se pudo recargar el índice vectorial local: {e}")
+
+    def __cargar(self):
+        meta_path = os.path.join(self.__persist_dir, _META)
+        firma = self.__firma_en_disco()
+        if firma is None:
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matriz = None
+        if meta["ids"]:
+            matriz = np.memmap(
+                os.path.join(self.__persist_dir, _VECTORES),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(meta["ids"]), meta["dim"]),
+            )
+        self.__snapshot = (meta["ids"], meta["texts"], meta["metadatas"], matriz)
+        self.__firma = firma
+        print(f"Índice vectorial local cargado: {len(self.__ids)} chunks desde {self.__persist_dir}")
+
+    def __escribir_meta(self, ids, textos, metadatos, dim):
+        meta_path = os.path.join(self.__persist_dir, _META)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "ids": ids, "texts": textos, "metadatas": metadatos}, f, ensure_ascii=False)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        self.__meta_pendiente = False
+
+    def __persistir(self, ids, textos, metadatos, matriz):
+        os.makedirs(self.__persist_dir, exist_ok=True)
+        vectores_path = os.path.join(self.__persist_dir, _VECTORES)
+
+        # Escribimos en temporales y reemplazamos: los lectores nunca ven un archivo a medias
+        matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        matriz.tofile(f"{vectores_path}.tmp")
+        os.replace(f"{vectores_path}.tmp", vectores_path)
+        self.__escribir_meta(ids, textos, metadatos, int(matriz.shape[1]) if matriz.size else 0)
+
+        # Publicamos todo junto en una sola asignación para que las búsquedas vean un estado coherente
+        self.__snapshot = (
+            ids,
+            textos,
+            metadatos,
+            np.memmap(vectores_path, dtype=np.float32, mode="r", shape=matriz.shape) if len(ids) else None,
+        )
+        self.__firma = self.__firma_en_disco()
+        if self.__ids_lote is not None:
+            self.__ids_lote = set(ids)
+
+    def __anexar(self, ids, textos, metadatos, vectores):
+        """Agrega filas nuevas al final del archivo de vectores sin reescribir las existentes."""
+        os.makedirs(self.__persist_dir, exist_ok=True)
+        vectores_path = os.path.join(self.__persist_dir, _VECTORES)
+        n, dim = len(self.__ids), vectores.shape[1]
+        if self.__matriz is not None and self.__matriz.shape[1] != dim:
+            raise ValueError(f"Dimensión {dim} distinta a la del índice ({self.__matriz.shape[1]})")
+
+        with open(vectores_path, "r+b" if os.path.exists(vectores_path) else "wb") as f:
+            # Si una ingesta anterior se cortó, puede haber filas de más que meta.json no conoce
+            f.truncate(n * dim * 4)
+            f.seek(n * dim * 4)
+            f.write(np.ascontiguousarray(vectores, dtype=np.float32).tobytes())
+
+        # Los lectores con el memmap anterior siguen viendo sus n filas intactas
+        total = n + len(ids)
+        self.__snapshot = (
+            self.__ids + ids,
+            self.__textos + textos,
+            self.__metadatos + metadatos,
+            np.memmap(vectores_path, dtype=np.float32, mode="r", shape=(total, dim)),
+        )
+        self.__ids_lote.update(ids)
+        self.__meta_pendiente = True
+
+    @contextmanager
+    def en_lote(self):
+        """Agrupa muchas escrituras (una ingesta): meta.json se escribe una sola vez al final."""
+        with self.__lock:
+            self.__ids_lote = set(self.__ids)
+        try:
+            yield self
+        finally:
+            with self.__lock:
+                self.__ids_lote = None
+                if self.__meta_pendiente:
+                    dim = self.__matriz.shape[1] if self.__matriz is not None else 0
+                    self.__escribir_meta(self.__ids, self.__textos, self.__metadatos, dim)
+                    self.__firma = self.__firma_en_disco()
+
+    #----------------------------------------- Escritura ------------------------------------------
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+
+        vectores = np.asarray(self.__embedding.embed_documents(texts), dtype=np.float32)
+        normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+        vectores = vectores / np.where(normas == 0, 1, normas)
+
+        with self.__lock:
+            if self.__ids_lote is not None and self.__ids_lote.isdisjoint(ids):
+                # Ingesta: solo ids nuevos, se anexan sin tocar lo ya escrito
+                self.__anexar(ids, texts, metadatas, vectores)
+                return ids
+            # Upsert: si el id ya existe se reemplaza la fila
+            nuevos = set(ids)
+            conservar = [i for i, id_ in enumerate(self.__ids) if id_ not in nuevos]
+            if self.__matriz is not None:
+                actual = np.asarray(self.__matriz[conservar])
+            else:
+                actual = np.empty((0, vectores.shape[1]), np.float32)
+            self.__persistir(
+                [self.__ids[i] for i in conservar] + ids,
+                [self.__textos[i] for i in conservar] + texts,
+                [self.__metadatos[i] for i in conservar] + metadatas,
+                np.vstack([actual, vectores]),
+            )
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self.__lock:
+            borrar = set(ids)
+            conservar = [i for i, id_ in enumerate(self.__ids) if id_ not in borrar]
+            if len(conservar) == len(self.__ids):
+                return False
+            dim = self.__matriz.shape[1]
+            self.__persistir(
+                [self.__ids[i] for i in conservar],
+                [self.__textos[i] for i in conservar],
+                [self.__metadatos[i] for i in conservar],
+                np.asarray(self.__matriz[conservar]) if conservar else np.empty((0, dim), np.float32),
+            )
+        return True
+
+    #------------------------------------------ Búsqueda ------------------------------------------
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        self.__recargar_si_cambio()
+        # Tomamos referencias locales: una escritura concurrente reemplaza, no modifica, la matriz
+        ids, textos, metadatos, matriz = self.__snapshot
+        if matriz is None or not len(ids):
+            return []
+
+        consulta = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma:
+            consulta = consulta / norma
+
+        scores = matriz @ consulta
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(page_content=textos[i], metadata={**metadatos[i], "id": ids[i]}), float(scores[i]))
+            for i in top
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        # Mismo contrato que SupabaseVectorStore: scores de relevancia en [0, 1]
+        relevancia = self._select_relevance_score_fn()
+        return [(doc, relevancia(score)) for doc, score in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.__embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    def get_all(self):
+        """Devuelve (ids, textos, metadatos) de todos los chunks del índice."""
+        # El retriever híbrido lo llama justo al ver un kb_version nuevo: tiene que leer lo último
+        self.__recargar_si_cambio(forzar=True)
+        return list(self.__ids), list(self.__textos), list(self.__metadatos)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_dir=LOCAL_VECTOR_STORE_DIR, **kwargs):
+        store = cls(embedding, persist_dir=persist_dir)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
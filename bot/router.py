@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from utils.contexto import chat_id_actual
+from utils.user_profile import user_profiles
+
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+
+SALUDO = "saludo"
+DESPEDIDA = "despedida"
+FAQ = "faq"
+MULTIMEDIA = "multimedia"
+AGENTE = "agente"
+RUTAS = (SALUDO, DESPEDIDA, FAQ, MULTIMEDIA, AGENTE)
+# Rutas que responden con plantillas propias, sin LLM
+PLANTILLAS = (SALUDO, DESPEDIDA)
+
+# Todo se compara sin tildes y en minúsculas (ver _normalizar)
+_MULTIMEDIA = re.compile(
+    r"https?://|www\.|youtu\.?be|\.(?:mp4|mp3|ogg|wav|m4a)\b|transcrib"
+)
+_LEAD = re.compile(
+    r"asesor|contact|llam(?:en|ar|ada)|comunicar|inscrib|matricul|registr|mi nombre es|me llamo|"
+    r"mi correo|[\w.+-]+@[\w-]+\.\w+"
+)
+# Si el último mensaje del bot pidió datos u ofreció un asesor, la respuesta del usuario
+# ("sí", "dale", su nombre...) sigue el flujo de registro
+_BOT_PIDE_DATOS = re.compile(
+    r"nombre completo|correo electronico|programa de interes|asesor|"
+    r"contactar(?:te|lo|la)|te contacte|inscribirte|matricularte|registrarte"
+)
+
+_SALUDOS = re.compile(
+    r"^(?:hola+|holi|buenas?|buen(?:os)? dias?|buenas (?:tardes|noches)|hey|que tal|saludos|alo|hi|hello)"
+    r"(?: (?:hola|buenas|que tal|como estas|databot|datapath))*$"
+)
+_DESPEDIDAS = re.compile(
+    r"^(?:ok |okey |bueno |listo |perfecto |genial |excelente )?"
+    r"(?:(?:muchas )?gracias(?: por (?:todo|la (?:ayuda|informacion)))?|chao|adios|hasta (?:luego|pronto)|"
+    r"nos vemos|eso (?:es|seria) todo|listo|bye)"
+    r"(?: (?:gracias|chao|adios|eso es todo|hasta luego|nos vemos))*$"
+)
+_NO_PALABRA = re.compile(r"[^a-z0-9@.:/ ]+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    # Sin emojis ni signos: "¡¡Hola!! 👋" -> "hola"
+    return _ESPACIOS.sub(" ", _NO_PALABRA.sub(" ", texto)).strip(" .:/")
+
+
+def clasificar(mensaje, historial=None):
+    """Decide la ruta de un mensaje sin llamar a ningún modelo.
+
+    historial viene de get_chat_history (más nuevos primero). Ante la duda se va al RAG:
+    solo multimedia y registro de interesados necesitan más que una respuesta.
+    """
+    texto = _normalizar(mensaje)
+    crudo = (mensaje or "").lower()
+
+    if _MULTIMEDIA.search(crudo) or _MULTIMEDIA.search(texto):
+        return MULTIMEDIA
+    if _LEAD.search(texto) or _LEAD.search(crudo):
+        return AGENTE
+    ultimo_bot = next((m.get("body") for m in (historial or []) if not m.get("isUser", False)), None)
+    if ultimo_bot and _BOT_PIDE_DATOS.search(_normalizar(ultimo_bot)):
+        return AGENTE
+
+    if _SALUDOS.match(texto):
+        return SALUDO
+    if _DESPEDIDAS.match(texto):
+        return DESPEDIDA
+    return FAQ
+
+
+def respuesta_saludo(nombre=None, ya_conversaron=False):
+    if ya_conversaron:
+        return f"¡Hola de nuevo{', ' + nombre if nombre else ''}! 😊 ¿En qué más puedo ayudarte sobre los programas de DataPath?"
+    if nombre:
+        return f"¡Hola {nombre}! 👋 Soy DataBot, el asistente de DataPath. ¿Qué te gustaría saber sobre nuestros cursos y programas?"
+    return "¡Hola! 👋 Soy DataBot, el asistente de DataPath. ¿Qué te gustaría saber sobre nuestros cursos y programas? 😊"
+
+
+def respuesta_despedida(nombre=None):
+    if nombre:
+        return f"¡Ha sido un placer ayudarte, {nombre}! Gracias por contactar con DataPath. Si tienes más preguntas en el futuro, no dudes en escribirnos nuevamente. ¡Que tengas un excelente día! 😊"
+    return "¡Ha sido un placer ayudarte! Gracias por contactar con DataPath. Si tienes más preguntas en el futuro, no dudes en escribirnos nuevamente. ¡Que tengas un excelente día! 😊"
+
+
+class IntentRouter:
+    """Pre-router local delante del agente.
+
+    Saludos y despedidas se responden con plantillas (sin LLM), las preguntas frecuentes
+    van directo a la chain RAG (una sola llamada al LLM), los videos van a la cola de
+    trabajos multimedia y solo el registro de interesados (o lo que la cola no sepa
+    procesar) pasa por el agente con tools. Lleva conteo y latencia por ruta.
+    """
+
+    def __init__(self, agente, rag, multimedia=None, enabled=INTENT_ROUTER_ENABLED):
+        # Cada handler recibe (mensaje, historial, resumen) y devuelve el texto a enviar.
+        # multimedia puede devolver None si no reconoce el contenido: entonces responde el agente.
+        self.__handlers = {FAQ: rag, MULTIMEDIA: multimedia, AGENTE: agente}
+        self.__enabled = enabled
+        self.__lock = threading.Lock()
+        self.__stats = {ruta: {"count": 0, "failed": 0, "latency_total": 0.0, "latency_max": 0.0} for ruta in RUTAS}
+
+    def procesar(self, mensaje, historial=None, resumen=None):
+        """Devuelve (respuesta, ruta). ruta es la que finalmente respondió."""
+        inicio = time.perf_counter()
+        ruta = clasificar(mensaje, historial) if self.__enabled else AGENTE
+        print(f"Router: mensaje enviado a la ruta '{ruta}'")
+        ok = False
+        try:
+            if ruta in PLANTILLAS:
+                perfil = user_profiles.get(chat_id_actual.get())
+                if ruta == SALUDO:
+                    # El mensaje actual ya está guardado: hay conversación previa si hay algo más
+                    # o si los turnos antiguos ya se resumieron
+                    ya_conversaron = len(historial or []) > 1 or bool(resumen)
+                    respuesta = respuesta_saludo(perfil["nombre"], ya_conversaron=ya_conversaron)
+                else:
+                    respuesta = respuesta_despedida(perfil["nombre"])
+            else:
+                handler = self.__handlers[ruta]
+                respuesta = handler(mensaje, historial, resumen) if handler is not None else None
+                if respuesta is None:
+                    # Lo que la ruta no supo atender lo responde el agente, y así se cuenta
+                    ruta = AGENTE
+                    respuesta = self.__handlers[AGENTE](mensaje, historial, resumen)
+            ok = True
+            return respuesta, ruta
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self.__lock:
+                stats = self.__stats[ruta]
+                stats["count"] += 1
+                stats["failed"] += not ok
+                stats["latency_total"] += duracion
+                stats["latency_max"] = max(stats["latency_max"], duracion)
+
+    def metrics(self):
+        with self.__lock:
+            rutas = {}
+            for ruta, stats in self.__stats.items():
+                rutas[ruta] = {
+                    "count": stats["count"],
+                    "failed": stats["failed"],
+                    "latency_avg": stats["latency_total"] / stats["count"] if stats["count"] else 0.0,
+                    "latency_max": stats["latency_max"],
+                }
+            total = sum(stats["count"] for stats in self.__stats.values())
+            return {
+                "enabled": self.__enabled,
+                "routes": rutas,
+                # Mensajes que no pagaron el bucle del agente (plantilla, RAG directo o cola multimedia)
+                "agent_bypass_rate": (total - self.__stats[AGENTE]["count"]) / total if total else 0.0,
+            }
@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # segundos
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# rag.py reescribe este archivo al terminar cada ingesta; si cambia, la caché se vacía
+KB_VERSION_FILE = os.getenv(
+    "KB_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RAG", "kb_version.txt"),
+)
+_KB_VERSION_CHECK_INTERVAL = 5.0
+
+# Preguntas que solo se entienden con la conversación anterior: "¿y cuánto cuesta?", "¿ese es online?"
+_CONECTOR_INICIAL = re.compile(r"^(?:y|e|o|pero|entonces|ademas|tambien|osea|o sea|ok y|vale y)\b")
+_REFERENCIA = re.compile(
+    r"\b(?:eso|esa|ese|esos|esas|esto|este|estos|aquel|aquella|ahi|alli|dicho|dicha|"
+    r"el mismo|la misma|lo mismo|anterior|mencionaste|dijiste|comentaste|lo que me)\b"
+)
+_PALABRA = re.compile(r"[a-z0-9]+")
+# Con tan pocas palabras, la pregunta casi siempre completa algo dicho antes ("¿precio?", "¿cuándo empieza?")
+_MIN_PALABRAS_AUTONOMA = 4
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def pregunta_autonoma(pregunta):
+    """True si la pregunta se entiende sola y su respuesta puede servir a otro chat.
+
+    Solo mira la pregunta, no el historial: en un chat normal siempre hay turnos previos
+    del bot (por ejemplo el saludo), y eso no vuelve dependiente a "¿qué cursos tienen?".
+    """
+    texto = _normalizar(pregunta).strip(" ¿¡")
+    palabras = _PALABRA.findall(texto)
+    if len(palabras) < _MIN_PALABRAS_AUTONOMA:
+        return False
+    return not (_CONECTOR_INICIAL.match(texto) or _REFERENCIA.search(texto))
+
+
+def leer_version_kb(path=KB_VERSION_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class SemanticCache:
+    """Caché semántica de respuestas del RAG.
+
+    Guarda el embedding normalizado de cada pregunta en una matriz NumPy y devuelve
+    la respuesta cacheada si una pregunta nueva supera el umbral de similitud coseno.
+    Las entradas expiran por TTL y, si la caché se llena, se expulsa la menos usada (LRU).
+    """
+
+    def __init__(self, embeddings, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.__embeddings = embeddings
+        self.__threshold = threshold
+        self.__ttl = ttl
+        self.__max_entries = max_entries
+        self.__lock = threading.Lock()
+
+        self.__vectores = None  # (max_entries, dim), se reserva con el primer embedding
+        self.__respuestas = [None] * max_entries
+        self.__namespaces = [None] * max_entries
+        self.__creado = np.zeros(max_entries)
+        self.__ultimo_uso = np.zeros(max_entries)
+        self.__ocupado = np.zeros(max_entries, dtype=bool)
+
+        self.__kb_version = leer_version_kb()
+        self.__kb_checked = time.monotonic()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+
+    def __embed(self, pregunta):
+        # Mismo texto que embebe el retriever: comparten la entrada de la caché de embeddings
+        vector = np.asarray(self.__embeddings.embed_query(pregunta), dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+
+    def __revisar_version_kb(self, ahora):
+        if ahora - self.__kb_checked < _KB_VERSION_CHECK_INTERVAL:
+            return
+        self.__kb_checked = ahora
+        version = leer_version_kb()
+        if version != self.__kb_version:
+            print(f"Base de conocimientos re-ingestada ({self.__kb_version} -> {version}), se vacía la caché semántica")
+            self.__kb_version = version
+            self.__vaciar()
+
+    def __vaciar(self):
+        self.__ocupado[:] = False
+        self.__respuestas = [None] * self.__max_entries
+        self.__namespaces = [None] * self.__max_entries
+        self.__invalidations += 1
+
+    def invalidate(self):
+        with self.__lock:
+            self.__vaciar()
+
+    def lookup(self, pregunta, namespace=None):
+        """Devuelve (respuesta, vector). respuesta es None en un miss; el vector se reutiliza en store()."""
+        vector = self.__embed(pregunta)
+        ahora = time.monotonic()
+        with self.__lock:
+            self.__revisar_version_kb(ahora)
+            if self.__vectores is not None:
+                # Las entradas vencidas se liberan antes de comparar
+                self.__ocupado &= (ahora - self.__creado) <= self.__ttl
+                candidatos = np.flatnonzero(self.__ocupado)
+                candidatos = [i for i in candidatos if self.__namespaces[i] == namespace]
+                if candidatos:
+                    similitudes = self.__vectores[candidatos] @ vector
+                    mejor = int(np.argmax(similitudes))
+                    if similitudes[mejor] >= self.__threshold:
+                        indice = candidatos[mejor]
+                        self.__ultimo_uso[indice] = ahora
+                        self.__hits += 1
+                        print(f"Caché semántica: hit (similitud {similitudes[mejor]:.3f})")
+                        return self.__respuestas[indice], vector
+            self.__misses += 1
+            return None, vector
+
+    def store(self, vector, respuesta, namespace=None):
+        ahora = time.monotonic()
+        with self.__lock:
+            if self.__vectores is None:
+                self.__vectores = np.zeros((self.__max_entries, vector.shape[0]), dtype=np.float32)
+            libres = np.flatnonzero(~self.__ocupado)
+            if libres.size:
+                indice = int(libres[0])
+            else:
+                indice = int(np.argmin(self.__ultimo_uso))
+                self.__evictions += 1
+            self.__vectores[indice] = vector
+            self.__respuestas[indice] = respuesta
+            self.__namespaces[indice] = namespace
+            self.__creado[indice] = ahora
+            self.__ultimo_uso[indice] = ahora
+            self.__ocupado[indice] = True
+
+    def metrics(self):
+        with self.__lock:
+            total = self.__hits + self.__misses
+            return {
+                "entries": int(self.__ocupado.sum()),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / total if total else 0.0,
+                "evictions": self.__evictions,
+                "invalidations": self.__invalidations,
+                "kb_version": self.__kb_version,
+            }
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from services.worker_pool import WorkerPool
+
+
+# Ventana de espera tras el último mensaje de un chat antes de procesar la ráfaga
+CHAT_DEBOUNCE_SECONDS = float(os.getenv("CHAT_DEBOUNCE_SECONDS", "1.5"))
+# Espera máxima desde el primer mensaje de la ráfaga, aunque el usuario siga escribiendo
+CHAT_DEBOUNCE_MAX_SECONDS = float(os.getenv("CHAT_DEBOUNCE_MAX_SECONDS", "6"))
+# Mensajes en espera entre todos los chats; por encima se rechaza (el webhook responde 503)
+CHAT_SCHEDULER_MAX_PENDING = int(os.getenv("CHAT_SCHEDULER_MAX_PENDING", "1000"))
+
+
+class _Chat:
+    __slots__ = ("mensajes", "primero", "ultimo", "en_curso")
+
+    def __init__(self):
+        self.mensajes = []
+        self.primero = None
+        self.ultimo = None
+        self.en_curso = False
+
+
+class ChatScheduler:
+    """Agrupa las ráfagas de mensajes de un mismo chat y los procesa en orden.
+
+    Cada mensaje espera CHAT_DEBOUNCE_SECONDS por si llegan más del mismo chat; la ráfaga
+    se envía al WorkerPool como un único evento (una sola corrida del agente). Un chat
+    nunca tiene más de un evento en proceso: lo que llega mientras tanto forma la
+    siguiente ráfaga. Chats distintos siguen corriendo en paralelo en el pool.
+    """
+
+    def __init__(self, handler, debounce=CHAT_DEBOUNCE_SECONDS, max_wait=CHAT_DEBOUNCE_MAX_SECONDS,
+                 max_pending=CHAT_SCHEDULER_MAX_PENDING, worker_pool=None):
+        self.__handler = handler
+        self.__debounce = debounce
+        self.__max_wait = max_wait
+        self.__max_pending = max_pending
+        self.worker_pool = worker_pool or WorkerPool(handler=self.__ejecutar)
+        self.__chats = {}
+        self.__pendientes = 0
+        self.__cond = threading.Condition()
+        self.__thread = None
+
+        # Métricas
+        self.__recibidos = 0
+        self.__corridas = 0
+        self.__rechazados = 0
+        self.__rafaga_max = 0
+
+    def submit(self, evento):
+        """Agrega el mensaje a la ráfaga de su chat. Devuelve False si hay demasiados en espera."""
+        ahora = time.monotonic()
+        with self.__cond:
+            if self.__pendientes >= self.__max_pending:
+                self.__rechazados += 1
+                print("Demasiados mensajes en espera, evento descartado")
+                return False
+            chat = self.__chats.get(evento["chat_id"])
+            if chat is None:
+                chat = self.__chats[evento["chat_id"]] = _Chat()
+            if not chat.mensajes:
+                chat.primero = ahora
+            chat.mensajes.append(evento["body"])
+            chat.ultimo = ahora
+            self.__pendientes += 1
+            self.__recibidos += 1
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="chat-scheduler", daemon=True)
+                self.__thread.start()
+            self.__cond.notify()
+        return True
+
+    def __vence(self, chat):
+        return min(chat.ultimo + self.__debounce, chat.primero + self.__max_wait)
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                listos = []
+                espera = None
+                ahora = time.monotonic()
+                for chat_id, chat in self.__chats.items():
+                    if chat.en_curso or not chat.mensajes:
+                        continue
+                    vence = self.__vence(chat)
+                    if vence <= ahora:
+                        listos.append((chat_id, chat))
+                    else:
+                        espera = vence - ahora if espera is None else min(espera, vence - ahora)
+
+                for chat_id, chat in listos:
+                    mensajes, chat.mensajes = chat.mensajes, []
+                    chat.en_curso = True
+                    self.__pendientes -= len(mensajes)
+                    self.__corridas += 1
+                    self.__rafaga_max = max(self.__rafaga_max, len(mensajes))
+                    if len(mensajes) > 1:
+                        print(f"Chat {chat_id}: {len(mensajes)} mensajes agrupados en una sola corrida")
+                    evento = {"chat_id": chat_id, "body": "\n".join(mensajes), "mensajes": mensajes}
+                    if not self.worker_pool.submit(evento):
+                        # Pool lleno: la ráfaga vuelve a su chat y se reintenta en la siguiente vuelta
+                        chat.mensajes[:0] = mensajes
+                        chat.en_curso = False
+                        self.__pendientes += len(mensajes)
+                        self.__corridas -= 1
+                        espera = self.__debounce if espera is None else min(espera, self.__debounce)
+
+                if not listos or espera is not None:
+                    self.__cond.wait(espera)
+
+    def __ejecutar(self, evento):
+        try:
+            self.__handler(evento)
+        finally:
+            with self.__cond:
+                chat = self.__chats.get(evento["chat_id"])
+                chat.en_curso = False
+                if not chat.mensajes:
+                    # Chat sin nada pendiente: no lo guardamos para siempre
+                    del self.__chats[evento["chat_id"]]
+                self.__cond.notify()
+
+    def metrics(self):
+        with self.__cond:
+            return {
+                "debounce_s": self.__debounce,
+                "messages_received": self.__recibidos,
+                "agent_runs": self.__corridas,
+                # Cada mensaje agrupado con otro es una corrida completa del agente (y sus LLM) que no se hizo
+                "runs_saved": self.__recibidos - self.__pendientes - self.__corridas,
+                "largest_burst": self.__rafaga_max,
+                "pending_messages": self.__pendientes,
+                "active_chats": sum(1 for chat in self.__chats.values() if chat.en_curso),
+                "rejected": self.__rechazados,
+            }
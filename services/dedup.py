@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# WAHA reintenta el webhook si no respondemos a tiempo: cada id se recuerda este tiempo
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "600"))  # segundos
+WEBHOOK_DEDUP_MAX_IDS = int(os.getenv("WEBHOOK_DEDUP_MAX_IDS", "10000"))
+# Con varios procesos (gunicorn, réplicas) el registro tiene que ser compartido
+WEBHOOK_DEDUP_REDIS_URL = os.getenv("WEBHOOK_DEDUP_REDIS_URL")
+_PREFIJO_REDIS = "waha:visto:"
+
+
+class SeenSet:
+    """Ids de mensajes ya recibidos, en memoria, con TTL y tamaño máximo.
+
+    Como todos los ids viven lo mismo, el orden de inserción es también el de vencimiento:
+    los vencidos (y, si hace falta, los más antiguos) se sacan por el principio.
+    """
+
+    backend = "memory"
+
+    def __init__(self, ttl=WEBHOOK_DEDUP_TTL, max_ids=WEBHOOK_DEDUP_MAX_IDS):
+        self.__ttl = ttl
+        self.__max_ids = max_ids
+        self.__vence = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def marcar(self, message_id):
+        """Registra el id. Devuelve True la primera vez y False si es un duplicado."""
+        ahora = time.monotonic()
+        with self.__lock:
+            while self.__vence and next(iter(self.__vence.values())) <= ahora:
+                self.__vence.popitem(last=False)
+            if message_id in self.__vence:
+                return False
+            self.__vence[message_id] = ahora + self.__ttl
+            while len(self.__vence) > self.__max_ids:
+                self.__vence.popitem(last=False)
+            return True
+
+    def olvidar(self, message_id):
+        with self.__lock:
+            self.__vence.pop(message_id, None)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__vence)
+
+
+class RedisSeenSet:
+    """Mismo contrato que SeenSet, compartido entre procesos con SET NX EX de Redis.
+
+    Si Redis no responde se usa el registro en memoria para no perder mensajes.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url, ttl=WEBHOOK_DEDUP_TTL):
+        import redis  # Dependencia opcional: solo hace falta con WEBHOOK_DEDUP_REDIS_URL
+        self.__redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.__ttl = int(ttl)
+        self.__local = SeenSet(ttl=ttl)
+
+    def marcar(self, message_id):
+        try:
+            return bool(self.__redis.set(_PREFIJO_REDIS + message_id, 1, nx=True, ex=self.__ttl))
+        except Exception as e:
+            print(f"Redis no disponible para deduplicar, se usa memoria: {e}")
+            return self.__local.marcar(message_id)
+
+    def olvidar(self, message_id):
+        self.__local.olvidar(message_id)
+        try:
+            self.__redis.delete(_PREFIJO_REDIS + message_id)
+        except Exception as e:
+            print(f"No se pudo liberar el id {message_id} en Redis: {e}")
+
+    def __len__(self):
+        return len(self.__local)
+
+
+def _message_id(payload):
+    message_id = payload.get("id")
+    if isinstance(message_id, dict):
+        # Algunas versiones de WAHA mandan el id serializado dentro de un objeto
+        message_id = message_id.get("_serialized") or message_id.get("id")
+    return str(message_id) if message_id else None
+
+
+def crear_seen_set():
+    if WEBHOOK_DEDUP_REDIS_URL:
+        try:
+            return RedisSeenSet(WEBHOOK_DEDUP_REDIS_URL)
+        except ImportError:
+            print("WEBHOOK_DEDUP_REDIS_URL definido pero el paquete redis no está instalado, se usa memoria")
+    return SeenSet()
+
+
+class WebhookDedup:
+    """Filtro barato del webhook: descarta lo que no hay que procesar antes de encolar nada."""
+
+    def __init__(self, seen_set=None):
+        self.__vistos = seen_set if seen_set is not None else crear_seen_set()
+        self.__lock = threading.Lock()
+        self.__contadores = {"accepted": 0, "duplicates": 0, "from_me": 0, "other_events": 0, "without_id": 0}
+
+    def __contar(self, clave):
+        with self.__lock:
+            self.__contadores[clave] += 1
+
+    def filtrar(self, data):
+        """Devuelve (procesar, motivo). motivo explica por qué se descarta el evento."""
+        evento = data.get("event")
+        if evento is not None and evento != "message":
+            self.__contar("other_events")
+            return False, f"Evento '{evento}' ignorado"
+
+        payload = data.get("payload") or {}
+        if payload.get("fromMe"):
+            self.__contar("from_me")
+            return False, "Mensaje propio ignorado"
+
+        message_id = _message_id(payload)
+        if not message_id:
+            # Sin id no se puede deduplicar; se procesa como antes
+            self.__contar("without_id")
+            return True, None
+        if not self.__vistos.marcar(message_id):
+            self.__contar("duplicates")
+            return False, "Evento duplicado ignorado"
+        self.__contar("accepted")
+        return True, None
+
+    def liberar(self, data):
+        """Olvida el id de un evento que no se pudo encolar, para aceptar el reintento de WAHA."""
+        message_id = _message_id(data.get("payload") or {})
+        if message_id:
+            self.__vistos.olvidar(message_id)
+
+    def metrics(self):
+        with self.__lock:
+            return {"backend": self.__vistos.backend, "tracked_ids": len(self.__vistos), **self.__contadores}
@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils import media_pipeline
+
+
+MEDIA_JOBS_ENABLED = os.getenv("MEDIA_JOBS_ENABLED", "1") == "1"
+# Procesos para las etapas pesadas de CPU (extracción de audio y Whisper)
+MEDIA_JOB_PROCESSES = int(os.getenv("MEDIA_JOB_PROCESSES", "2"))
+# Trabajos que avanzan a la vez; cada uno coordina sus etapas desde un hilo
+MEDIA_JOB_CONCURRENCY = int(os.getenv("MEDIA_JOB_CONCURRENCY", str(MEDIA_JOB_PROCESSES)))
+MEDIA_JOB_MAX_QUEUE = int(os.getenv("MEDIA_JOB_MAX_QUEUE", "20"))
+
+_YOUTUBE = re.compile(r"https?://(?:www\.|m\.)?(?:youtube\.com|youtu\.be)/\S+", re.IGNORECASE)
+_ARCHIVO = re.compile(r"[^\s'\"]+\.(?:mp4|mov|mkv|webm|mp3|ogg|opus|wav|m4a|flac)\b", re.IGNORECASE)
+
+# cpu=True: el cálculo se ejecuta en el pool de procesos; si no, en el hilo del trabajo (red o LLM).
+# La caché multimedia se consulta siempre desde el hilo del trabajo: su lock single-flight es por
+# proceso, así dos trabajos del mismo video no repiten ffmpeg ni Whisper en procesos distintos.
+Etapa = namedtuple("Etapa", "nombre aviso funcion cpu")
+
+_ACUSE = (
+    "⏳ ¡Recibido! Estoy procesando tu video. Te iré avisando en cada etapa y te enviaré la nota "
+    "cuando esté lista. Mientras tanto puedes seguir escribiéndome. 😊"
+)
+# encolar() ya envió y guardó su respuesta: no queda nada que mandar
+YA_RESPONDIDO = ""
+
+_DESCARGA = Etapa("descarga", "📥 Descargando el video de YouTube...", media_pipeline.descargar_youtube, False)
+_AUDIO = Etapa("audio", "🎧 Extrayendo el audio...", media_pipeline.extraer_audio, True)
+_TRANSCRIPCION = Etapa("transcripcion", "📝 Transcribiendo el audio, esto es lo que más tarda...", media_pipeline.transcribir_audio, True)
+_NOTA = Etapa("nota", "✍️ Preparando tu nota con el resumen...", media_pipeline.crear_nota, False)
+
+
+def planificar(mensaje):
+    """Devuelve (origen, etapas) si el mensaje trae un enlace de YouTube o un archivo local, o None."""
+    match = _YOUTUBE.search(mensaje or "")
+    if match:
+        return match.group(0), [_DESCARGA, _AUDIO, _TRANSCRIPCION, _NOTA]
+    match = _ARCHIVO.search(mensaje or "")
+    if match and os.path.exists(match.group(0)):
+        # extraer_audio deja pasar los archivos que ya son audio
+        return match.group(0), [_AUDIO, _TRANSCRIPCION, _NOTA]
+    return None
+
+
+class MediaJobQueue:
+    """Cola de trabajos multimedia, fuera del camino de los mensajes.
+
+    encolar() envía el acuse de recibo al instante y recién entonces arranca el trabajo, que
+    avanza en segundo plano, avisa por WAHA al
+    empezar cada etapa y al final envía la nota. Las etapas de CPU corren en un pool de
+    procesos propio, así los workers del webhook siguen atendiendo a los demás chats.
+    """
+
+    def __init__(self, enviar, guardar, procesos=MEDIA_JOB_PROCESSES, concurrencia=MEDIA_JOB_CONCURRENCY,
+                 max_queue=MEDIA_JOB_MAX_QUEUE):
+        # enviar(chat_id, texto) manda un mensaje; guardar(chat_id, texto) lo registra en el historial
+        self.__enviar = enviar
+        self.__guardar = guardar
+        self.__procesos = procesos
+        self.__max_queue = max_queue
+        self.__hilos = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="media-job")
+        self.__pool = None
+        self.__lock = threading.Lock()
+
+        # Métricas
+        self.__en_cola = 0
+        self.__corriendo = 0
+        self.__completados = 0
+        self.__fallidos = 0
+        self.__rechazados = 0
+        self.__etapas = {}  # nombre -> [cantidad, segundos]
+
+    def __get_pool(self):
+        with self.__lock:
+            if self.__pool is None:
+                # spawn: los procesos no heredan hilos ni locks del servidor
+                self.__pool = ProcessPoolExecutor(
+                    max_workers=self.__procesos, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self.__pool
+
+    def __en_pool(self, funcion, *args, **kwargs):
+        return self.__get_pool().submit(funcion, *args, **kwargs).result()
+
+    def encolar(self, chat_id, mensaje):
+        """Devuelve YA_RESPONDIDO si encoló el trabajo, el texto de rechazo si la cola está llena,
+        o None si el mensaje no trae multimedia procesable."""
+        plan = planificar(mensaje)
+        if plan is None:
+            return None
+        origen, etapas = plan
+        with self.__lock:
+            if self.__en_cola + self.__corriendo >= self.__max_queue:
+                self.__rechazados += 1
+                return "😓 Ahora mismo estoy procesando muchos videos. Por favor, vuelve a enviármelo en unos minutos."
+            self.__en_cola += 1
+        # El acuse sale (y se guarda) antes de arrancar el trabajo: ni el primer aviso de
+        # progreso ni una nota que salga de la caché pueden llegar antes que él
+        self.__avisar(chat_id, _ACUSE)
+        self.__guardar(chat_id, _ACUSE)
+        self.__hilos.submit(self.__ejecutar, chat_id, origen, etapas)
+        return YA_RESPONDIDO
+
+    def __ejecutar(self, chat_id, origen, etapas):
+        with self.__lock:
+            self.__en_cola -= 1
+            self.__corriendo += 1
+        valor = origen
+        ok = False
+        try:
+            for i, etapa in enumerate(etapas, 1):
+                self.__avisar(chat_id, f"({i}/{len(etapas)}) {etapa.aviso}")
+                inicio = time.perf_counter()
+                if etapa.cpu:
+                    valor = etapa.funcion(valor, ejecutar=self.__en_pool)
+                else:
+                    valor = etapa.funcion(valor)
+                with self.__lock:
+                    stats = self.__etapas.setdefault(etapa.nombre, [0, 0.0])
+                    stats[0] += 1
+                    stats[1] += time.perf_counter() - inicio
+            nota = valor
+            ok = True
+        except Exception as e:
+            print(f"Error en el trabajo multimedia de {chat_id} ({origen}): {e}")
+            nota = "😓 No pude procesar tu video. Revisa que el enlace o el archivo sea válido e inténtalo de nuevo."
+        finally:
+            with self.__lock:
+                self.__corriendo -= 1
+                if ok:
+                    self.__completados += 1
+                else:
+                    self.__fallidos += 1
+        self.__avisar(chat_id, nota)
+        self.__guardar(chat_id, nota)
+
+    def __avisar(self, chat_id, texto):
+        try:
+            self.__enviar(chat_id, texto)
+        except Exception as e:
+            print(f"No se pudo enviar el aviso del trabajo multimedia a {chat_id}: {e}")
+
+    def metrics(self):
+        with self.__lock:
+            return {
+                "enabled": MEDIA_JOBS_ENABLED,
+                "processes": self.__procesos,
+                "queued": self.__en_cola,
+                "running": self.__corriendo,
+                "completed": self.__completados,
+                "failed": self.__fallidos,
+                "rejected": self.__rechazados,
+                "stage_avg_s": {nombre: total / n for nombre, (n, total) in self.__etapas.items()},
+            }
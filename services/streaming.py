@@ -0,0 +1,214 @@
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "80"))  # no se envían mensajes más cortos que esto
+STREAM_MAX_CHARS = int(os.getenv("STREAM_MAX_CHARS", "1000"))  # sin fin de oración, se corta igual
+
+# Tags de los LLM cuya salida puede ir directo al usuario
+TAG_AGENTE = "respuesta_agente"
+TAG_RAG = "respuesta_rag"
+
+_PARRAFO = re.compile(r"\n\s*\n")
+_BLANCOS = re.compile(r"\s+")
+# Fin de oración: ., !, ? o … seguido de espacio, sin cortar "1. " de las listas ni decimales
+_ORACION = re.compile(r"(?<=[^\d\s][.!?…])\s+|\n")
+
+# Respuesta en curso de este hilo; LangChain agrega su handler a todas las corridas del contexto
+_respuesta_actual = ContextVar("respuesta_en_streaming", default=None)
+register_configure_hook(_respuesta_actual, inheritable=True)
+
+
+class SentenceChunker:
+    """Acumula tokens y los libera en trozos que terminan en párrafo u oración."""
+
+    def __init__(self, min_chars=STREAM_MIN_CHARS, max_chars=STREAM_MAX_CHARS):
+        self.__min_chars = min_chars
+        self.__max_chars = max_chars
+        self.__buffer = ""
+
+    def __corte(self):
+        if len(self.__buffer) < self.__min_chars:
+            return None
+        # Preferimos cortar en párrafos; si no hay, en la última oración completa
+        parrafos = [m.end() for m in _PARRAFO.finditer(self.__buffer, self.__min_chars)]
+        if parrafos:
+            return parrafos[-1]
+        oraciones = [m.end() for m in _ORACION.finditer(self.__buffer, self.__min_chars - 1)]
+        if oraciones:
+            return oraciones[-1]
+        if len(self.__buffer) >= self.__max_chars:
+            espacio = self.__buffer.rfind(" ", 0, self.__max_chars)
+            return espacio + 1 if espacio > 0 else self.__max_chars
+        return None
+
+    def agregar(self, token):
+        """Devuelve los trozos que quedaron completos con este token."""
+        self.__buffer += token
+        trozos = []
+        corte = self.__corte()
+        while corte is not None:
+            trozo, self.__buffer = self.__buffer[:corte].strip(), self.__buffer[corte:]
+            if trozo:
+                trozos.append(trozo)
+            corte = self.__corte()
+        return trozos
+
+    def cerrar(self):
+        trozo, self.__buffer = self.__buffer.strip(), ""
+        return [trozo] if trozo else []
+
+
+class _StreamingStats:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__respuestas = 0
+        self.__en_streaming = 0
+        self.__mensajes = 0
+        self.__primer_mensaje_total = 0.0
+        self.__primer_mensaje_max = 0.0
+        self.__total = 0.0
+        self.__total_max = 0.0
+
+    def registrar(self, primer_mensaje, total, mensajes):
+        with self.__lock:
+            self.__respuestas += 1
+            self.__en_streaming += mensajes > 1
+            self.__mensajes += mensajes
+            self.__primer_mensaje_total += primer_mensaje
+            self.__primer_mensaje_max = max(self.__primer_mensaje_max, primer_mensaje)
+            self.__total += total
+            self.__total_max = max(self.__total_max, total)
+
+    def metrics(self):
+        with self.__lock:
+            n = self.__respuestas
+            return {
+                "enabled": STREAM_REPLIES,
+                "replies": n,
+                "streamed_replies": self.__en_streaming,
+                "messages_per_reply": self.__mensajes / n if n else 0.0,
+                "time_to_first_message_avg": self.__primer_mensaje_total / n if n else 0.0,
+                "time_to_first_message_max": self.__primer_mensaje_max,
+                "total_latency_avg": self.__total / n if n else 0.0,
+                "total_latency_max": self.__total_max,
+            }
+
+
+_stats = _StreamingStats()
+
+
+def streaming_metrics():
+    return _stats.metrics()
+
+
+def excluir_del_streaming(tag):
+    """La salida de los LLM con este tag no va al usuario (por ejemplo, si el agente la reescribe)."""
+    respuesta = _respuesta_actual.get()
+    if respuesta is not None:
+        respuesta.excluir(tag)
+
+
+class RespuestaEnStreaming(BaseCallbackHandler):
+    """Envía la respuesta final por WAHA a medida que el LLM la genera, oración por oración.
+
+    Se registra como handler de LangChain mientras dura activa(); solo escucha los LLM
+    marcados con TAG_AGENTE o TAG_RAG. Los trozos se envían en orden desde un hilo propio
+    para no frenar la lectura del stream. Si no llegó ningún token (plantillas, caché,
+    errores), terminar() envía la respuesta completa en un solo mensaje; si el stream se
+    cortó y la respuesta final es otra (un error o un texto de respaldo), la envía también.
+    """
+
+    def __init__(self, waha, chat_id, inicio=None):
+        self.__waha = waha
+        self.__chat_id = chat_id
+        self.__inicio = inicio if inicio is not None else time.perf_counter()
+        self.__tags = {TAG_AGENTE, TAG_RAG}
+        self.__chunker = SentenceChunker()
+        self.__cola = queue.Queue()
+        self.__thread = None
+        self.__transmitio = False
+        self.__texto_stream = []
+        self.__enviados = 0
+        self.__textos_enviados = []
+        self.__fallidos = 0
+        self.__primer_mensaje = None
+
+    #------------------------------------- Callbacks de LangChain ------------------------------------
+    def excluir(self, tag):
+        self.__tags.discard(tag)
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if not token or not self.__tags.intersection(tags or ()):
+            return
+        self.__transmitio = True
+        self.__texto_stream.append(token)
+        for trozo in self.__chunker.agregar(token):
+            self.__encolar(trozo)
+
+    #------------------------------------------ Envío -----------------------------------------------
+    def __encolar(self, trozo):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name=f"stream-{self.__chat_id}", daemon=True)
+            self.__thread.start()
+        self.__cola.put(trozo)
+
+    def __run(self):
+        while True:
+            trozo = self.__cola.get()
+            if trozo is None:
+                return
+            try:
+                self.__waha.send_message(chat_id=self.__chat_id, message=trozo)
+                if self.__primer_mensaje is None:
+                    self.__primer_mensaje = time.perf_counter() - self.__inicio
+                self.__enviados += 1
+                self.__textos_enviados.append(trozo)
+            except Exception as e:
+                self.__fallidos += 1
+                print(f"Error al enviar un trozo de la respuesta a {self.__chat_id}: {e}")
+
+    @contextmanager
+    def activa(self):
+        token = _respuesta_actual.set(self)
+        try:
+            yield self
+        finally:
+            _respuesta_actual.reset(token)
+
+    def terminar(self, respuesta):
+        """Envía lo que falte, espera a que salga el último trozo y devuelve el texto que recibió el usuario."""
+        completa = True
+        if self.__transmitio:
+            for trozo in self.__chunker.cerrar():
+                self.__encolar(trozo)
+            # Sin espacios: los trozos se envían recortados pero el texto tiene que ser el mismo
+            if respuesta and _BLANCOS.sub("", "".join(self.__texto_stream)) != _BLANCOS.sub("", respuesta):
+                self.__encolar(respuesta)
+                completa = False
+        elif respuesta:
+            self.__encolar(respuesta)
+
+        if self.__thread is not None:
+            self.__cola.put(None)
+            self.__thread.join()
+
+        total = time.perf_counter() - self.__inicio
+        _stats.registrar(self.__primer_mensaje if self.__primer_mensaje is not None else total, total, self.__enviados)
+        print(
+            f"Respuesta a {self.__chat_id}: {self.__enviados} mensajes, primer mensaje en "
+            f"{(self.__primer_mensaje or total):.2f}s, total {total:.2f}s"
+        )
+        if completa and not self.__fallidos:
+            return respuesta
+        # Al historial va solo lo que de verdad salió por WhatsApp
+        return "\n\n".join(self.__textos_enviados)
@@ -1,65 +1,186 @@
+import asyncio
+import os
+import random
+import threading
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+WAHA_API_URL = os.getenv('WAHA_API_URL', 'http://waha:3000')
+WAHA_SESSION = os.getenv('WAHA_SESSION', 'default') #Porque estamos en el plan gratuito
+
+# Timeouts acotados (segundos): conexión y lectura
+WAHA_CONNECT_TIMEOUT = float(os.getenv('WAHA_CONNECT_TIMEOUT', '3'))
+WAHA_READ_TIMEOUT = float(os.getenv('WAHA_READ_TIMEOUT', '15'))
+
+# Reintentos con backoff exponencial y jitter
+WAHA_RETRIES = int(os.getenv('WAHA_RETRIES', '3'))
+WAHA_BACKOFF = float(os.getenv('WAHA_BACKOFF', '0.3'))
+WAHA_BACKOFF_JITTER = float(os.getenv('WAHA_BACKOFF_JITTER', '0.3'))
+WAHA_POOL_SIZE = int(os.getenv('WAHA_POOL_SIZE', '10'))
+
+# Solo reintentamos respuestas que indican que WAHA no procesó la petición.
+# No reintentamos timeouts de lectura en POST para no duplicar mensajes enviados.
+RETRY_STATUS = (429, 502, 503, 504)
+
+HEADERS = {
+    'Content-Type': 'application/json',
+}
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Sesión HTTP compartida: mantiene conexiones keep-alive con WAHA entre mensajes."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=WAHA_RETRIES,
+                    connect=WAHA_RETRIES,
+                    read=0,
+                    status=WAHA_RETRIES,
+                    backoff_factor=WAHA_BACKOFF,
+                    backoff_jitter=WAHA_BACKOFF_JITTER,
+                    status_forcelist=RETRY_STATUS,
+                    allowed_methods=frozenset(['GET', 'POST']),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=WAHA_POOL_SIZE,
+                    pool_maxsize=WAHA_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
 
 class Waha:
 
-    def __init__(self):
-        self.__api_url = 'http://waha:3000'
+    def __init__(self, api_url=None, session=None):
+        self.__api_url = (api_url or WAHA_API_URL).rstrip('/')
+        self.__session = session or WAHA_SESSION
+        self.__http = get_http_session()
+        self.__timeout = (WAHA_CONNECT_TIMEOUT, WAHA_READ_TIMEOUT)
+
+    def __post(self, path, payload):
+        response = self.__http.post( #con este post respondemos el mensaje
+            url=f'{self.__api_url}{path}',
+            json=payload,
+            timeout=self.__timeout,
+        )
+        if not response.ok:
+            print(f'WAHA respondió {response.status_code} en {path}: {response.text}')
+        return response
 
     #chat_id: para quien voy a envirar el mensaje
     def send_message(self, chat_id, message):
-        url = f'{self.__api_url}/api/sendText'
-        headers = {
-            'Content-Type': 'application/json',
-        }
         payload = {
-            'session': 'default', #Porque estamos en el plan gratuito
+            'session': self.__session,
             'chatId': chat_id,
             'text': message,
         }
-        requests.post( #con este post respondemos el mensaje
-            url=url,
-            json=payload,
-            headers=headers,
-        )
+        self.__post('/api/sendText', payload)
 
     #Esto más me va a servir en cuanto yo construya mi sistema RAG
     def get_history_messages(self, chat_id, limit):
-        url = f'{self.__api_url}/api/default/chats/{chat_id}/messages?limit={limit}&downloadMedia=false'
-        headers = {
-            'Content-Type': 'application/json',
-        }
-        response = requests.get(
-            url=url,
-            headers=headers,
+        response = self.__http.get(
+            url=f'{self.__api_url}/api/{self.__session}/chats/{chat_id}/messages',
+            params={'limit': limit, 'downloadMedia': 'false'},
+            timeout=self.__timeout,
         )
         return response.json()
 
     def start_typing(self, chat_id):
-        url = f'{self.__api_url}/api/startTyping'
-        headers = {
-            'Content-Type': 'application/json',
+        payload = {
+            'session': self.__session,
+            'chatId': chat_id,
+        }
+        self.__post('/api/startTyping', payload)
+
+    def stop_typing(self, chat_id):
+        payload = {
+            'session': self.__session,
+            'chatId': chat_id,
         }
+        self.__post('/api/stopTyping', payload)
+
+
+class AsyncWaha:
+    """Variante asyncio de Waha con la misma API (los métodos son corrutinas)."""
+
+    def __init__(self, api_url=None, session=None, client=None):
+        self.__api_url = (api_url or WAHA_API_URL).rstrip('/')
+        self.__session = session or WAHA_SESSION
+        self.__client = client or httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(WAHA_READ_TIMEOUT, connect=WAHA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=WAHA_POOL_SIZE, max_keepalive_connections=WAHA_POOL_SIZE),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.__client.aclose()
+
+    async def __request(self, method, path, **kwargs):
+        url = f'{self.__api_url}{path}'
+        for intento in range(WAHA_RETRIES + 1):
+            try:
+                response = await self.__client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Como en la sesión síncrona (connect=WAHA_RETRIES, read=0): solo se reintenta si
+                # la petición no llegó a salir, así un envío nunca se duplica
+                if intento == WAHA_RETRIES:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or intento == WAHA_RETRIES:
+                    if response.is_error:
+                        print(f'WAHA respondió {response.status_code} en {path}: {response.text}')
+                    return response
+            # Backoff exponencial con jitter, igual que en la sesión síncrona
+            await asyncio.sleep(WAHA_BACKOFF * (2 ** intento) + random.uniform(0, WAHA_BACKOFF_JITTER))
+
+    async def send_message(self, chat_id, message):
         payload = {
-            'session': 'default',
+            'session': self.__session,
             'chatId': chat_id,
+            'text': message,
         }
-        requests.post(
-            url=url,
-            json=payload,
-            headers=headers,
+        await self.__request('POST', '/api/sendText', json=payload)
+
+    async def get_history_messages(self, chat_id, limit):
+        response = await self.__request(
+            'GET',
+            f'/api/{self.__session}/chats/{chat_id}/messages',
+            params={'limit': limit, 'downloadMedia': 'false'},
         )
+        return response.json()
 
-    def stop_typing(self, chat_id):
-        url = f'{self.__api_url}/api/stopTyping'
-        headers = {
-            'Content-Type': 'application/json',
+    async def start_typing(self, chat_id):
+        payload = {
+            'session': self.__session,
+            'chatId': chat_id,
         }
+        await self.__request('POST', '/api/startTyping', json=payload)
+
+    async def stop_typing(self, chat_id):
         payload = {
-            'session': 'default',
+            'session': self.__session,
             'chatId': chat_id,
         }
-        requests.post(
-            url=url,
-            json=payload,
-            headers=headers,
-        )
\ No newline at end of file
+        await self.__request('POST', '/api/stopTyping', json=payload)
@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+
+
+class WorkerPool:
+    """Pool de hilos que procesa en segundo plano los eventos recibidos por el webhook."""
+
+    def __init__(self, handler, num_workers=None, max_queue=None):
+        self.__handler = handler
+        self.__num_workers = num_workers or int(os.getenv("WEBHOOK_WORKERS", "4"))
+        max_queue = max_queue if max_queue is not None else int(os.getenv("WEBHOOK_MAX_QUEUE", "1000"))
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__threads = []
+        self.__lock = threading.Lock()
+        self.__started = False
+
+        # Métricas
+        self.__busy = 0
+        self.__processed = 0
+        self.__failed = 0
+        self.__rejected = 0
+        self.__latency_total = 0.0
+        self.__latency_max = 0.0
+        self.__latency_last = 0.0
+
+    def start(self):
+        with self.__lock:
+            if self.__started:
+                return
+            for i in range(self.__num_workers):
+                thread = threading.Thread(target=self.__run, name=f"webhook-worker-{i}", daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+            self.__started = True
+        print(f"WorkerPool iniciado con {self.__num_workers} workers")
+
+    def submit(self, evento):
+        """Encola el evento sin bloquear. Devuelve False si la cola está llena."""
+        self.start()
+        try:
+            self.__queue.put_nowait((time.monotonic(), evento))
+            return True
+        except queue.Full:
+            with self.__lock:
+                self.__rejected += 1
+            print("Cola de eventos llena, evento descartado")
+            return False
+
+    def __run(self):
+        while True:
+            encolado_en, evento = self.__queue.get()
+            with self.__lock:
+                self.__busy += 1
+            try:
+                self.__handler(evento)
+                ok = True
+            except Exception as e:
+                print(f"Error en el worker procesando el evento: {e}")
+                ok = False
+            finally:
+                latencia = time.monotonic() - encolado_en
+                with self.__lock:
+                    self.__busy -= 1
+                    if ok:
+                        self.__processed += 1
+                    else:
+                        self.__failed += 1
+                    self.__latency_total += latencia
+                    self.__latency_max = max(self.__latency_max, latencia)
+                    self.__latency_last = latencia
+                self.__queue.task_done()
+
+    def metrics(self):
+        with self.__lock:
+            terminados = self.__processed + self.__failed
+            return {
+                "workers": self.__num_workers,
+                "queue_depth": self.__queue.qsize(),
+                "busy_workers": self.__busy,
+                "utilization": self.__busy / self.__num_workers if self.__num_workers else 0.0,
+                "processed": self.__processed,
+                "failed": self.__failed,
+                "rejected": self.__rejected,
+                "latency_avg_s": self.__latency_total / terminados if terminados else 0.0,
+                "latency_max_s": self.__latency_max,
+                "latency_last_s": self.__latency_last,
+            }
@@ -1,44 +1,35 @@
 from langchain.tools import tool
 from langchain.tools import StructuredTool
 
-from utils.download_youtube_yt_dlp import YoutubeDownloader
-from utils.audio import Audio
-from utils.crea_partes_notas import Notes
+# Las etapas multimedia (con su caché) se comparten con la cola de trabajos de services/media_jobs.py
+from utils import media_pipeline
 
 from utils.envio_correo import EnvioCorreo
 from utils.registro_google_sheet import RegistroGoogleSheet
 
-from bot.ai_bot import AIBot
-
-import os
+from bot.ai_bot import get_ai_bot
 
 class DataPathTools:
     #============================================================================
     @tool
     def bajar_video_de_youtube(link: str) -> str:
         """Descarga un video desde un enlace de YouTube y devuelve la ruta del archivo descargado."""
-        video_path = YoutubeDownloader().bajar_video(link)
-        return video_path
+        return media_pipeline.descargar_youtube(link)
     
     @tool
     def extraer_audio(video_path):
         """Extrae el audio de un video y lo guarda en formato WAV."""
-        audio_path = Audio.extraer(video_path)
-        return audio_path
+        return media_pipeline.extraer_audio(video_path)
     
     @tool
     def transcribir_audio(audio_path: str) -> str:
         """Transcribe un archivo de audio guardado en audio_path a texto."""
-        transcripcion_path = Audio.transcribir(audio_path)
-        if not os.path.exists(transcripcion_path):
-            raise FileNotFoundError(f"El archivo de transcripción no existe: {transcripcion_path}")
-        return transcripcion_path
+        return media_pipeline.transcribir_audio(audio_path)
     
     @tool
     def guardar_nota(transcripcion_path):
         """Guarda el texto final en un archivo de texto dentro del directorio _notas y además devuelve los resumenes al usuario."""
-        notas = Notes.guardar_nota(transcripcion_path)
-        return notas
+        return media_pipeline.crear_nota(transcripcion_path)
     #==========================================================================
 
     @staticmethod
@@ -68,26 +59,26 @@ class DataPathTools:
     
     # Agregar RAG como Tool
     @staticmethod
-    def consultar_DataPath(query: str, history_messages=None) -> str:
+    def consultar_DataPath(query: str, history_messages=None, resumen=None) -> str:
         """Usa el sistema RAG para buscar información sobre DataPath y devuelve la respuesta."""
         # Imprime lo que recibe la tool en el parámetro history_messages
         print("En la tool 'consultar_DataPath', history_messages recibido:")
         print(history_messages)
         
-        rag_instance = AIBot()  # Inicializar el sistema RAG
+        rag_instance = get_ai_bot()  # Motor RAG compartido (se construye una sola vez)
         
         # Usa historial de mensajes si está disponible
         if history_messages:
             try:
                 # No necesitamos convertir el formato, ya que AIBot.__build_messages ya lo hace
                 # Simplemente pasamos el history_messages tal como viene
-                response = rag_instance.invoke(history_messages, query)
+                response = rag_instance.invoke(history_messages, query, resumen=resumen)
             except Exception as e:
                 print(f"Error al procesar el historial en consultar_DataPath: {e}")
                 # Fallback a invocación sin historial
-                response = rag_instance.invoke([], query)
+                response = rag_instance.invoke([], query, resumen=resumen)
         else:
-            response = rag_instance.invoke([], query)
+            response = rag_instance.invoke([], query, resumen=resumen)
             
         return response
 
@@ -1,72 +1,243 @@
+import multiprocessing
 import os
+import queue
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
 
 from moviepy.editor import *
 
+import av
 from faster_whisper import WhisperModel
 
+from utils.transcripcion_paralela import TranscriptorParalelo
+
 from dotenv import load_dotenv
 load_dotenv()
 
+# Configuración de Whisper
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small") # "medium", "large-v3"...
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu") # "cuda"
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8") # int8 en CPU, float16 en GPU
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0")) # 0 = lo decide CTranslate2
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+WHISPER_POOL_SIZE = int(os.getenv("WHISPER_POOL_SIZE", "1"))
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "0") == "1"
+
+# Pipeline solo-audio: YouTube baja solo el audio y los MP4 se demultiplexan con ffmpeg
+MEDIA_AUDIO_ONLY = os.getenv("MEDIA_AUDIO_ONLY", "1") == "1"
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.opus', '.m4a', '.flac')
+
+# Modo paralelo por chunks para audios largos
+WHISPER_PARALLEL = os.getenv("WHISPER_PARALLEL", "0") == "1"
+WHISPER_PARALLEL_MIN_SECONDS = float(os.getenv("WHISPER_PARALLEL_MIN_SECONDS", "600"))
+WHISPER_PROCESSES = int(os.getenv("WHISPER_PROCESSES", "0")) # 0 = la mitad de los núcleos
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "60"))
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE") or None # Fijarlo evita que cada chunk detecte el idioma
+
+
+class WhisperPool:
+    """Pool acotado de modelos Whisper cargados una sola vez y reutilizados entre transcripciones."""
+
+    def __init__(self, size=WHISPER_POOL_SIZE):
+        self.__size = size
+        self.__models = queue.Queue()
+        self.__created = 0
+        self.__lock = threading.Lock()
+
+    def __load_model(self):
+        inicio = time.perf_counter()
+        model = WhisperModel(
+            WHISPER_MODEL,
+            device=WHISPER_DEVICE,
+            compute_type=WHISPER_COMPUTE_TYPE,
+            cpu_threads=WHISPER_CPU_THREADS,
+        )
+        print(
+            f"Modelo Whisper '{WHISPER_MODEL}' ({WHISPER_DEVICE}, {WHISPER_COMPUTE_TYPE}) "
+            f"cargado en {time.perf_counter() - inicio:.2f} s"
+        )
+        return model
+
+    def preload(self):
+        """Carga todos los modelos del pool por adelantado (por ejemplo al arrancar la app)."""
+        while True:
+            with self.__lock:
+                if self.__created >= self.__size:
+                    return
+                self.__created += 1
+            self.__models.put(self.__load_model())
+
+    @contextmanager
+    def acquire(self):
+        """Presta un modelo del pool; si todos están ocupados espera a que se libere uno."""
+        model = None
+        try:
+            model = self.__models.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                crear = self.__created < self.__size
+                if crear:
+                    self.__created += 1
+            if crear:
+                try:
+                    model = self.__load_model()
+                except Exception:
+                    with self.__lock:
+                        self.__created -= 1
+                    raise
+            else:
+                model = self.__models.get()
+        try:
+            yield model
+        finally:
+            self.__models.put(model)
+
+
+whisper_pool = WhisperPool()
+# Solo precargamos en el proceso principal, no en los procesos del modo paralelo
+if WHISPER_PRELOAD and multiprocessing.parent_process() is None:
+    whisper_pool.preload()
+
+transcriptor_paralelo = TranscriptorParalelo(
+    WHISPER_MODEL,
+    WHISPER_DEVICE,
+    WHISPER_COMPUTE_TYPE,
+    processes=WHISPER_PROCESSES or None,
+    beam_size=WHISPER_BEAM_SIZE,
+    chunk_seconds=WHISPER_CHUNK_SECONDS,
+    language=WHISPER_LANGUAGE,
+)
+
+
+def _duracion_audio(audio_path):
+    with av.open(audio_path) as contenedor:
+        return (contenedor.duration or 0) / av.time_base
+
+
+def _formatea_tiempo(segundos):
+    horas, resto = divmod(int(segundos), 3600)
+    minutos, segundos = divmod(resto, 60)
+    return f"{horas:02d}:{minutos:02d}:{segundos:02d}"
+
+
+def _con_sufijo(base_name, sufijo):
+    # El sufijo (hash del contenido) evita que dos archivos con el mismo nombre se pisen
+    if sufijo and not base_name.endswith(f'_{sufijo}'):
+        return f'{base_name}_{sufijo}'
+    return base_name
+
+
+def _ruta_transcripcion(audio_path, sufijo=None):
+    #Creamos la carpeta que guarda los audios extraídos de los vídeos
+    output_path = os.path.dirname(audio_path)
+    output_path = output_path.replace('audios', 'transcripciones')
+    base_name = _con_sufijo(os.path.splitext(os.path.basename(audio_path))[0], sufijo)
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+        print(f"Carpeta creada '{output_path}'")
+
+    return f'{output_path}/{base_name}.md'
+
+
 class Audio:
-    def extraer(video_path):
+    def extraer(video_path, sufijo=None):
         #video_path = f'/app/{video_path}'
-        """Extrae el audio de un vídeo y guarda en formato .mp3."""
+        """Extrae el audio de un vídeo y lo guarda en .wav 16 kHz mono (o .mp3 con MEDIA_AUDIO_ONLY=0)."""
         print(f"\nExtrayendo audio del video: {video_path}")
         
         video_path = video_path.replace("'", "") #Garantizamos que el vídeo no tenga comillas simples
         
         print(f'video_path = {video_path}')
+
+        # Si ya es un audio (por ejemplo el que deja YoutubeDownloader.bajar_audio) no hay nada que extraer
+        if video_path.lower().endswith(AUDIO_EXTENSIONS):
+            print(f'El archivo ya es audio, se usa directamente: {video_path}')
+            return video_path
         
         output_path = os.path.dirname(video_path)
         output_path = output_path.replace('videos', 'audios_extraídos')
         print(f'output_path = {output_path}')
         
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        base_name = _con_sufijo(os.path.splitext(os.path.basename(video_path))[0], sufijo)
         print(f'basename = {base_name}')
 
-        audio_path = f'{output_path}/{base_name}.mp3'
-        print(f'audio_path = {audio_path}')
-
-        video = VideoFileClip(video_path)
-
         #Creamos la carpeta que guarda los audios extraídos de los vídeos
         if not os.path.exists(output_path):
             os.makedirs(output_path)
             print(f"Carpeta creada {output_path}")
         #----------------------------------------------------------------
 
-        video.audio.write_audiofile(audio_path)
+        if MEDIA_AUDIO_ONLY:
+            # ffmpeg solo lee la pista de audio (-vn): no decodifica vídeo ni pasa por MP3
+            audio_path = f'{output_path}/{base_name}.wav'
+            print(f'audio_path = {audio_path}')
+            subprocess.run(
+                ['ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-i', video_path,
+                 '-vn', '-ac', '1', '-ar', '16000', '-c:a', 'pcm_s16le', audio_path],
+                check=True,
+            )
+        else:
+            audio_path = f'{output_path}/{base_name}.mp3'
+            print(f'audio_path = {audio_path}')
+            video = VideoFileClip(video_path)
+            video.audio.write_audiofile(audio_path)
 
         print(f'Audio guardado en: {audio_path}')
         print("") #Para dejar un espacio entre esta y la segunda función que se va a ejecutar
         return audio_path
 
-    def transcribir(audio_path: str) -> str:
+    def transcribir(audio_path: str, on_segment=None, sufijo=None) -> str:
         """Transcribe un archivo de audio guardado en audio_path a texto utilizando reconocimiento de voz."""
         print(f"Transcribiendo audio: {audio_path}")
         
         audio_path = audio_path.replace("'", "") #Garantizamos que el vídeo no tenga comillas simples
-        model = WhisperModel("small") # , "cuda" "medium"
 
-        result = model.transcribe(audio_path)
+        if WHISPER_PARALLEL and _duracion_audio(audio_path) >= WHISPER_PARALLEL_MIN_SECONDS:
+            return Audio.transcribir_paralelo(audio_path, on_segment=on_segment, sufijo=sufijo)
+
+        # El modelo se toma del pool compartido en lugar de cargarlo en cada llamada
+        with whisper_pool.acquire() as model:
+            inicio = time.perf_counter()
+            segments, info = model.transcribe(audio_path, beam_size=WHISPER_BEAM_SIZE, language=WHISPER_LANGUAGE)
+            # transcribe devuelve un generador: la inferencia ocurre al recorrerlo
+            textos = []
+            for segment in segments:
+                textos.append(segment.text)
+                if on_segment:
+                    on_segment(segment)
+            transcripcion = " ".join(textos)
+            duracion = time.perf_counter() - inicio
+        print(f"Inferencia Whisper: {duracion:.2f} s para {info.duration:.1f} s de audio")
+
+        transcripcion_path = _ruta_transcripcion(audio_path, sufijo)
+        with open(transcripcion_path, 'w') as f:
+            f.write(transcripcion.strip())
 
-        transcripcion = ""
-        for segment in result[0]:
-            transcripcion += segment.text + " "
+        print(f'Transcripción guardada en: {transcripcion_path}')
+        return transcripcion_path
 
-        #Creamos la carpeta que guarda los audios extraídos de los vídeos
-        output_path = os.path.dirname(audio_path)
-        output_path = output_path.replace('audios', 'transcripciones')
-        base_name = os.path.splitext(os.path.basename(audio_path))[0]
-        transcripcion_path = f'{output_path}/{base_name}.md'
+    def transcribir_stream(audio_path: str):
+        """Genera los segmentos (start, end, text) del audio en orden mientras se transcriben en paralelo."""
+        audio_path = audio_path.replace("'", "")
+        return transcriptor_paralelo.transcribir_stream(audio_path)
 
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-            print(f"Carpeta creada '{output_path}'")
+    def transcribir_paralelo(audio_path: str, on_segment=None, sufijo=None) -> str:
+        """Transcribe un audio largo por chunks en varios procesos y guarda la transcripción con timestamps."""
+        print(f"Transcribiendo audio en paralelo: {audio_path}")
+        inicio = time.perf_counter()
 
+        transcripcion_path = _ruta_transcripcion(audio_path, sufijo)
+        # Escribimos cada segmento en cuanto llega, en orden, sin acumular todo en memoria
         with open(transcripcion_path, 'w') as f:
-            f.write(transcripcion.strip())
+            for segmento in Audio.transcribir_stream(audio_path):
+                f.write(f"[{_formatea_tiempo(segmento.start)}] {segmento.text}\n")
+                if on_segment:
+                    on_segment(segmento)
 
+        print(f"Inferencia Whisper en paralelo: {time.perf_counter() - inicio:.2f} s")
         print(f'Transcripción guardada en: {transcripcion_path}')
         return transcripcion_path
 
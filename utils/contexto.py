@@ -0,0 +1,7 @@
+from contextvars import ContextVar
+
+# Estado por request. Cada worker fija estos valores antes de ejecutar el agente,
+# así el agente y sus tools se comparten entre hilos sin guardar estado en la instancia.
+historial_actual = ContextVar("historial_actual", default=None)
+chat_id_actual = ContextVar("chat_id_actual", default=None)
+resumen_actual = ContextVar("resumen_actual", default=None)
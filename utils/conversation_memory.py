@@ -0,0 +1,254 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from utils.db_utils import get_supabase_client, flush_chat_history
+
+# Memoria de conversación por chat: los últimos turnos van literales al prompt y los
+# anteriores se pliegan en un resumen que se actualiza en segundo plano.
+#
+# Tabla en Supabase (junto a chat_history):
+#   create table chat_summary (
+#       chat_id text primary key,
+#       summary text not null,
+#       resumido_hasta timestamptz not null,  -- created_at del último mensaje incluido en el resumen
+#       updated_at timestamptz not null default now()
+#   );
+CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "1") == "1"
+MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))  # mensajes literales tras cada resumen
+MEMORY_SUMMARY_EVERY = int(os.getenv("MEMORY_SUMMARY_EVERY", "6"))  # mensajes nuevos que disparan un resumen
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "250"))
+MEMORY_MAX_CHATS = int(os.getenv("MEMORY_MAX_CHATS", "1000"))
+MEMORY_SUMMARY_MODEL = os.getenv("MEMORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+# Sin memoria se mantiene el comportamiento anterior: los últimos 10 mensajes tal cual
+_VENTANA_SIN_MEMORIA = 10
+
+# Como mucho se pliegan estos mensajes por resumen, aunque el chat venga de muy atrás
+_MAX_MENSAJES_POR_RESUMEN = 50
+
+_FRACCION = re.compile(r"\.(\d+)")
+
+_PROMPT_RESUMEN = """Eres el módulo de memoria de DataBot, el asistente de WhatsApp de DataPath.
+Actualiza el resumen de la conversación incorporando los mensajes nuevos.
+
+Conserva: nombre, correo y programa de interés del usuario si los dio, las preguntas que hizo y lo
+que se le respondió en lo esencial, pedidos pendientes (contacto con un asesor, notas de videos) y
+si ya se le saludó. Descarta saludos repetidos y detalles que no cambien la conversación.
+Escribe en español, en tercera persona, en un máximo de 120 palabras.
+
+Resumen actual:
+{resumen}
+
+Mensajes nuevos:
+{mensajes}
+
+Resumen actualizado:"""
+
+
+def _parse_fecha(valor):
+    """Convierte el created_at de Supabase (o el que fija store_chat_history) en datetime UTC."""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor
+    texto = valor.replace("Z", "+00:00")
+    # Python 3.10 solo acepta 3 o 6 decimales; Supabase puede devolver otra cantidad
+    texto = _FRACCION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), texto, count=1)
+    fecha = datetime.fromisoformat(texto)
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+class _Estado:
+    __slots__ = ("resumen", "resumido_hasta")
+
+    def __init__(self, resumen=None, resumido_hasta=None):
+        self.resumen = resumen
+        self.resumido_hasta = resumido_hasta
+
+
+class ConversationMemory:
+    """Memoria de conversación acotada: resumen incremental + ventana de mensajes recientes.
+
+    preparar() corre en el camino del mensaje y solo lee el resumen (caché LRU por chat).
+    Cuando un chat acumula suficientes mensajes sin resumir, se encola y un hilo en segundo
+    plano pliega los más antiguos en el resumen con una llamada al LLM y lo guarda en chat_summary.
+    Así el prompt de cada turno tiene como máximo un resumen + recientes + cada mensajes literales.
+    """
+
+    def __init__(self, recientes=MEMORY_RECENT_MESSAGES, cada=MEMORY_SUMMARY_EVERY,
+                 max_chats=MEMORY_MAX_CHATS, enabled=CONVERSATION_MEMORY_ENABLED):
+        self.__recientes = recientes
+        self.__cada = cada
+        self.__max_chats = max_chats
+        self.__enabled = enabled
+        self.__estados = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__llm = None
+
+        self.__cola = queue.Queue()
+        self.__en_cola = set()
+        self.__thread = None
+
+        # Métricas
+        self.__resumenes = 0
+        self.__mensajes_resumidos = 0
+        self.__fallidos = 0
+        self.__latencia_total = 0.0
+
+    @property
+    def ventana(self):
+        """Cuántos mensajes hay que pedir a get_chat_history."""
+        return self.__recientes + self.__cada if self.__enabled else _VENTANA_SIN_MEMORIA
+
+    #--------------------------------------- Estado por chat ---------------------------------------
+    def __estado(self, chat_id):
+        with self.__lock:
+            estado = self.__estados.get(chat_id)
+            if estado is not None:
+                self.__estados.move_to_end(chat_id)
+                return estado
+
+        # Primer mensaje del chat en este proceso: leemos el resumen guardado (una sola vez)
+        estado = _Estado()
+        try:
+            response = (
+                get_supabase_client().table("chat_summary")
+                .select("summary, resumido_hasta")
+                .eq("chat_id", chat_id)
+                .limit(1)
+                .execute()
+            )
+            if response.data:
+                fila = response.data[0]
+                estado = _Estado(fila["summary"], _parse_fecha(fila["resumido_hasta"]))
+        except Exception as e:
+            print(f"Error al leer el resumen del chat {chat_id}: {e}")
+            return estado  # No lo cacheamos: se reintenta en el siguiente mensaje
+
+        return self.__recordar(chat_id, estado)
+
+    def __recordar(self, chat_id, estado):
+        with self.__lock:
+            self.__estados[chat_id] = estado
+            self.__estados.move_to_end(chat_id)
+            while len(self.__estados) > self.__max_chats:
+                self.__estados.popitem(last=False)
+        return estado
+
+    #------------------------------------------ Hot path -------------------------------------------
+    def preparar(self, chat_id, historial):
+        """Devuelve (resumen, mensajes) para el prompt.
+
+        historial viene de get_chat_history (más nuevos primero) con `ventana` mensajes.
+        Solo se conservan los posteriores al resumen; si ya son demasiados, se agenda otro resumen.
+        """
+        if not self.__enabled:
+            return None, historial
+
+        estado = self.__estado(chat_id)
+        mensajes = historial
+        if estado.resumido_hasta is not None:
+            mensajes = [
+                m for m in historial
+                if m.get("created_at") is None or _parse_fecha(m["created_at"]) > estado.resumido_hasta
+            ]
+
+        if len(mensajes) >= self.__recientes + self.__cada:
+            self.programar(chat_id)
+        return estado.resumen, mensajes
+
+    def programar(self, chat_id):
+        """Encola el chat para resumir en segundo plano (una sola vez aunque llegue varias veces)."""
+        with self.__lock:
+            if chat_id in self.__en_cola:
+                return
+            self.__en_cola.add(chat_id)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="conversation-summarizer", daemon=True)
+                self.__thread.start()
+        self.__cola.put(chat_id)
+
+    #----------------------------------------- Background ------------------------------------------
+    def __run(self):
+        while True:
+            chat_id = self.__cola.get()
+            try:
+                self.__resumir(chat_id)
+            except Exception as e:
+                with self.__lock:
+                    self.__fallidos += 1
+                print(f"Error al resumir la conversación {chat_id}: {e}")
+            finally:
+                with self.__lock:
+                    self.__en_cola.discard(chat_id)
+
+    def __resumir(self, chat_id):
+        inicio = time.perf_counter()
+
+        # Los mensajes a resumir tienen que estar en Supabase
+        flush_chat_history()
+        estado = self.__estado(chat_id)
+
+        query = (
+            get_supabase_client().table("chat_history")
+            .select("sender, message, created_at")
+            .eq("chat_id", chat_id)
+        )
+        if estado.resumido_hasta is not None:
+            query = query.gt("created_at", estado.resumido_hasta.isoformat())
+        response = query.order("created_at", desc=True).limit(_MAX_MENSAJES_POR_RESUMEN).execute()
+        filas = list(reversed(response.data or []))
+
+        # Los más recientes quedan fuera: siguen yendo literales al prompt
+        a_resumir = filas[:-self.__recientes] if self.__recientes else filas
+        if len(a_resumir) < self.__cada:
+            return
+
+        mensajes = "\n".join(
+            f"{'Usuario' if fila['sender'] == 'user' else 'DataBot'}: {fila['message']}" for fila in a_resumir
+        )
+        prompt = _PROMPT_RESUMEN.format(resumen=estado.resumen or "(sin resumen todavía)", mensajes=mensajes)
+        resumen = self.__get_llm().invoke(prompt).content.strip()
+        resumido_hasta = _parse_fecha(a_resumir[-1]["created_at"])
+
+        get_supabase_client().table("chat_summary").upsert({
+            "chat_id": chat_id,
+            "summary": resumen,
+            "resumido_hasta": resumido_hasta.isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+        self.__recordar(chat_id, _Estado(resumen, resumido_hasta))
+
+        duracion = time.perf_counter() - inicio
+        with self.__lock:
+            self.__resumenes += 1
+            self.__mensajes_resumidos += len(a_resumir)
+            self.__latencia_total += duracion
+        print(f"Resumen del chat {chat_id} actualizado con {len(a_resumir)} mensajes en {duracion:.2f}s")
+
+    def __get_llm(self):
+        # Import diferido: solo lo necesita el hilo de resúmenes
+        if self.__llm is None:
+            from langchain_openai import ChatOpenAI
+            self.__llm = ChatOpenAI(model=MEMORY_SUMMARY_MODEL, temperature=0, max_tokens=MEMORY_SUMMARY_MAX_TOKENS)
+        return self.__llm
+
+    def metrics(self):
+        with self.__lock:
+            return {
+                "enabled": self.__enabled,
+                "chats": len(self.__estados),
+                "pending": len(self.__en_cola),
+                "summaries": self.__resumenes,
+                "messages_summarized": self.__mensajes_resumidos,
+                "failed": self.__fallidos,
+                "latency_avg": self.__latencia_total / self.__resumenes if self.__resumenes else 0.0,
+            }
+
+
+conversation_memory = ConversationMemory()
@@ -1,15 +1,53 @@
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 load_dotenv()
 
+from utils.media_cache import media_cache, hash_texto
+
 llm = ChatOpenAI(model='gpt-4o-mini', temperature=0)
 
+# Modo de generación de la nota:
+#   secuencial   -> cuatro llamadas al LLM una detrás de otra (comportamiento original)
+#   concurrente  -> las mismas cuatro llamadas en paralelo
+#   estructurado -> una sola llamada con salida estructurada que devuelve las cuatro secciones
+NOTES_MODE = os.getenv("NOTES_MODE", "concurrente")
+
+
+class NotaEstructurada(BaseModel):
+    """Secciones de la nota generadas en una sola llamada."""
+    tags: str = Field(description="Hasta 10 etiquetas en una única línea, separadas por espacio y con # al inicio, por ejemplo: #filosofía #fitness")
+    resumen_corto: str = Field(description="Resumen del texto en 20 palabras")
+    resumen_detallado: str = Field(description="Resumen detallado y estructurado con toda la información importante, para que una persona que no leyó el texto original pueda entenderlo completamente")
+    puntos_clave: str = Field(description="Ideas principales del texto enumeradas en puntos clave")
+
+
+def _tokens(mensaje):
+    uso = getattr(mensaje, 'usage_metadata', None) or {}
+    return {
+        'input_tokens': uso.get('input_tokens', 0),
+        'output_tokens': uso.get('output_tokens', 0),
+    }
+
+
+def _suma_tokens(usos):
+    return {
+        'input_tokens': sum(u['input_tokens'] for u in usos),
+        'output_tokens': sum(u['output_tokens'] for u in usos),
+    }
+
+
 class Notes:
     def crea_tags(texto):
         """Crea etiquetas relacionadas con el texto."""
+        return Notes._crea_tags(texto)[0]
+
+    def _crea_tags(texto):
         print('Creando etiquetas...')
         tags = llm.invoke(
             f'Crea hasta 10 etiquetas relacionadas con este texto: \n{texto}\n'
@@ -20,33 +58,76 @@ class Notes:
             f'Otro ejemplo, un texto sobre entrenamiento en el gimnasio puede tener las etiquetas #fitness #salud.\n'
             f'Todas las etiquetas deben llevar # al inicio, por ejemplo: #ejemplo.'
             )
-        return tags.content
+        return tags.content, _tokens(tags)
 
     def crea_resumen_corto(texto):
         """Crea un resumen corto de hasta 20 palabras de la transcripción."""
+        return Notes._crea_resumen_corto(texto)[0]
+
+    def _crea_resumen_corto(texto):
         print('Creando resumen corto...')
         resumen_corto = llm.invoke(
             f'Crea un resumen del texto en 20 palabras: \n{texto}'
             )
-        return resumen_corto.content
+        return resumen_corto.content, _tokens(resumen_corto)
 
     def crea_resumen_detallado(texto):
         """Crea un resumen detallado de la transcripción."""
+        return Notes._crea_resumen_detallado(texto)[0]
+
+    def _crea_resumen_detallado(texto):
         print('Creando resumen detallado...')
         resumen_detallado= llm.invoke(
             f'Resume detalladamente el texto: \n{texto}\n'
             f'Mantén toda la información importante de forma estructurada.\n'
             f'El resumen debe contener toda la información necesaria para que una persona que no leyó el texto original pueda entenderlo completamente.'
             )
-        return resumen_detallado.content
+        return resumen_detallado.content, _tokens(resumen_detallado)
 
     def crea_bullet_point(texto):
         """Crea una lista de puntos clave basada en la transcripción."""
+        return Notes._crea_bullet_point(texto)[0]
+
+    def _crea_bullet_point(texto):
         print('Creando lista de puntos clave...')
         bullet_point = llm.invoke(
             f'Enumera en puntos clave las ideas principales relacionadas con el texto: \n{texto}'
             )
-        return bullet_point.content
+        return bullet_point.content, _tokens(bullet_point)
+
+    def crea_secciones(texto, modo=None):
+        """Genera etiquetas, resúmenes y puntos clave según el modo y reporta tiempo y tokens."""
+        modo = modo or NOTES_MODE
+        inicio = time.perf_counter()
+        pasos = [Notes._crea_tags, Notes._crea_resumen_corto, Notes._crea_resumen_detallado, Notes._crea_bullet_point]
+
+        if modo == 'estructurado':
+            print('Creando nota completa en una sola llamada...')
+            respuesta = llm.with_structured_output(NotaEstructurada, include_raw=True).invoke(
+                f'Analiza el siguiente texto y genera sus etiquetas, un resumen corto, '
+                f'un resumen detallado y sus puntos clave: \n{texto}'
+            )
+            parsed = respuesta['parsed']
+            if parsed is None:
+                raise ValueError(f"No se pudo interpretar la nota estructurada: {respuesta.get('parsing_error')}")
+            secciones = (parsed.tags, parsed.resumen_corto, parsed.resumen_detallado, parsed.puntos_clave)
+            uso = _tokens(respuesta['raw'])
+        elif modo == 'concurrente':
+            # Las cuatro llamadas son independientes: las lanzamos a la vez
+            with ThreadPoolExecutor(max_workers=len(pasos)) as executor:
+                resultados = list(executor.map(lambda paso: paso(texto), pasos))
+            secciones = tuple(contenido for contenido, _ in resultados)
+            uso = _suma_tokens([u for _, u in resultados])
+        else:
+            resultados = [paso(texto) for paso in pasos]
+            secciones = tuple(contenido for contenido, _ in resultados)
+            uso = _suma_tokens([u for _, u in resultados])
+
+        print(
+            f"Nota generada en modo '{modo}': {time.perf_counter() - inicio:.2f} s, "
+            f"{uso['input_tokens']} tokens de entrada, {uso['output_tokens']} tokens de salida"
+        )
+        return secciones, uso
 
     def formatea_nota(tags, resumen_corto, resumen_detallado, bullet_point):
         """Da formato a los textos en una única nota con título, etiquetas y resúmenes."""
@@ -88,14 +169,17 @@ class Notes:
         if not os.path.exists(transcripcion_path):
             raise FileNotFoundError(f"No se encontró el archivo: {transcripcion_path}")
 
-        with open(transcripcion_path, "rb") as file:
+        # Decodificamos la transcripción una sola vez (antes se enviaban los bytes crudos a cada llamada)
+        with open(transcripcion_path, "r", encoding="utf-8", errors="replace") as file:
             transcripcion = file.read()
-            tags = Notes.crea_tags(transcripcion)
-            resumen_corto = Notes.crea_resumen_corto(transcripcion)
-            resumen_detallado = Notes.crea_resumen_detallado(transcripcion)
-            bullet_point = Notes.crea_bullet_point(transcripcion)
-            nota = Notes.formatea_nota(tags, resumen_corto, resumen_detallado, bullet_point)
-            print ('nota creada\n\n')
+
+        def crear_nota():
+            (tags, resumen_corto, resumen_detallado, bullet_point), _ = Notes.crea_secciones(transcripcion)
+            return Notes.formatea_nota(tags, resumen_corto, resumen_detallado, bullet_point)
+
+        # La nota se cachea por el contenido de la transcripción: si ya existe se sirve sin llamar al LLM
+        nota = media_cache.get_or_compute('nota', hash_texto(transcripcion), crear_nota)
+        print ('nota creada\n\n')
 
         output_path = os.path.dirname(transcripcion_path)
         output_path = output_path.replace('transcripciones_extraídos_descargados', 'notas')
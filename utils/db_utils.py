@@ -1,25 +1,174 @@
 # db_utils.py
 
+import atexit
 import os
+import threading
+import time
+from datetime import datetime, timezone
+
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from utils.history_cache import HistoryCache, HISTORY_CACHE_TURNS
+
 load_dotenv()
 
+# Write-behind de chat_history: los inserts se agrupan y se escriben en bloque
+CHAT_HISTORY_WRITE_BEHIND = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "1") == "1"
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "20"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+CHAT_HISTORY_MAX_PENDING = int(os.getenv("CHAT_HISTORY_MAX_PENDING", "5000"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
 def get_supabase_client() -> Client:
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-    return create_client(supabase_url, supabase_key)
+    """Devuelve el cliente de Supabase compartido por todo el proceso."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                supabase_url = os.getenv("SUPABASE_URL")
+                supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+                _client = create_client(supabase_url, supabase_key)
+    return _client
+
+
+class ChatHistoryBuffer:
+    """Buffer write-behind para chat_history.
+
+    Acumula las filas y las inserta en un único bulk insert cuando se llena el lote
+    o cuando pasa el intervalo de flush. Al cerrar el proceso se vacía por completo.
+    Si se pasa de max_pending, el hilo que agrega escribe en el acto; solo si Supabase
+    sigue fallando se descartan las filas más antiguas (y se cuentan en las métricas).
+    """
+
+    def __init__(self, batch_size=CHAT_HISTORY_BATCH_SIZE, flush_interval=CHAT_HISTORY_FLUSH_INTERVAL,
+                 max_pending=CHAT_HISTORY_MAX_PENDING):
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__max_pending = max_pending
+        self.__pending = []
+        self.__inflight = []  # Filas que se están insertando en este momento
+        self.__cond = threading.Condition()
+        self.__flush_lock = threading.Lock()
+        self.__closed = False
+        self.__descartadas = 0
+        self.__thread = threading.Thread(target=self.__run, name="chat-history-flusher", daemon=True)
+        self.__thread.start()
+
+    def add(self, row):
+        with self.__cond:
+            self.__pending.append(row)
+            lleno = len(self.__pending) > self.__max_pending
+            if len(self.__pending) >= self.__batch_size:
+                self.__cond.notify()
+        if not lleno:
+            return
+        # El flusher no da abasto: escribimos desde este hilo en lugar de perder turnos
+        self.flush()
+        with self.__cond:
+            if len(self.__pending) > self.__max_pending:
+                descartadas = len(self.__pending) - self.__max_pending
+                del self.__pending[:descartadas]
+                self.__descartadas += descartadas
+                print(f"Buffer de chat_history lleno y Supabase sin responder, se descartaron {descartadas} filas antiguas")
+
+    def pending_for(self, chat_id):
+        """Filas aún no escritas de un chat, en orden de llegada."""
+        with self.__cond:
+            return [row for row in self.__inflight + self.__pending if row["chat_id"] == chat_id]
+
+    def flush(self):
+        # Un solo flush a la vez para conservar el orden de inserción
+        with self.__flush_lock:
+            with self.__cond:
+                rows, self.__pending = self.__pending, []
+                self.__inflight = rows
+            if not rows:
+                return
+            try:
+                response = get_supabase_client().table("chat_history").insert(rows).execute()
+                if hasattr(response, 'error') and response.error is not None:
+                    raise RuntimeError(response.error)
+                print(f"{len(rows)} mensajes almacenados correctamente en chat_history")
+                with self.__cond:
+                    self.__inflight = []
+            except Exception as e:
+                print("Error al almacenar los mensajes, se reintentará:", e)
+                with self.__cond:
+                    self.__inflight = []
+                    self.__pending[:0] = rows
+
+    def metrics(self):
+        with self.__cond:
+            return {
+                "pending_writes": len(self.__pending) + len(self.__inflight),
+                "dropped_writes": self.__descartadas,
+            }
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify()
+        self.__thread.join(timeout=self.__flush_interval + 5)
+        self.flush()
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                limite = time.monotonic() + self.__flush_interval
+                while not self.__closed and len(self.__pending) < self.__batch_size:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self.__cond.wait(restante)
+                if self.__closed:
+                    return
+            self.flush()
+
+
+_buffer = ChatHistoryBuffer() if CHAT_HISTORY_WRITE_BEHIND else None
+if _buffer is not None:
+    atexit.register(_buffer.close)
+
+# Caché en memoria del historial reciente de cada chat
+_history_cache = HistoryCache()
+
+
+def history_cache_metrics() -> dict:
+    metrics = _history_cache.metrics()
+    if _buffer is not None:
+        metrics.update(_buffer.metrics())
+    return metrics
+
+
+def flush_chat_history() -> None:
+    """Fuerza la escritura de los mensajes pendientes."""
+    if _buffer is not None:
+        _buffer.flush()
+
 
 def store_chat_history(chat_id: str, sender: str, message: str) -> None:
-    client = get_supabase_client()
     data = {
         "chat_id": chat_id,
         "sender": sender,
-        "message": message
+        "message": message,
+        # Fijamos la hora al encolar para que el orden se mantenga al insertar en bloque
+        "created_at": datetime.now(timezone.utc).isoformat(),
     }
+
+    # Write-through: el siguiente get_chat_history de este chat no necesita ir a Supabase
+    _history_cache.append(chat_id, _row_to_message(data))
+
+    if _buffer is not None:
+        _buffer.add(data)
+        return
+
+    client = get_supabase_client()
     response = client.table("chat_history").insert(data).execute()
-    
+
     # Comprobar si el objeto response tiene el atributo 'error'
     if hasattr(response, 'error') and response.error is not None:
         print("Error al almacenar el mensaje:", response.error)
@@ -27,32 +176,50 @@ def store_chat_history(chat_id: str, sender: str, message: str) -> None:
         print("Mensaje almacenado correctamente:", response.data)
 
 
+def _row_to_message(row) -> dict:
+    # Si 'sender' es "user", consideramos que es un mensaje del usuario.
+    is_user = (row["sender"] == "user")
+    return {
+        "body": row["message"],
+        "isUser": is_user,
+        # La memoria de conversación lo usa para saber qué mensajes ya están resumidos
+        "created_at": row.get("created_at"),
+    }
+
+
 def get_chat_history(chat_id: str, limit: int = 10) -> list:
-    client = get_supabase_client()
-    response = (
-        client.table("chat_history")
-        .select("*")
-        .eq("chat_id", chat_id)
-        .order("created_at", desc=True)  # Orden cronológico descendente (los más nuevos primero)
-        .limit(limit)
-        .execute()
-    )
-
-    
-    # Si el objeto response tiene un atributo 'error' y no es None,
-    # consideramos que hubo un error.
-    if hasattr(response, "error") and response.error is not None:
-        print("Error al obtener el histórico:", response.error)
-        return []
-    
-    # Si no hay error, extraemos los datos
-    data = response.data or []
-    messages = []
-    for row in data:
-        # Si 'sender' es "user", consideramos que es un mensaje del usuario.
-        is_user = (row["sender"] == "user")
-        messages.append({
-            "body": row["message"],
-            "isUser": is_user
-        })
-    return messages
+    cached = _history_cache.get(chat_id, limit)
+    if cached is not None:
+        return cached
+
+    # En un miss leemos lo suficiente para llenar el ring buffer del chat
+    fetch_limit = max(limit, HISTORY_CACHE_TURNS)
+
+    # Los mensajes aún en el buffer son los más nuevos: van primero
+    pendientes = _buffer.pending_for(chat_id) if _buffer is not None else []
+    rows = list(reversed(pendientes))
+
+    if len(rows) < fetch_limit:
+        client = get_supabase_client()
+        response = (
+            client.table("chat_history")
+            .select("*")
+            .eq("chat_id", chat_id)
+            .order("created_at", desc=True)  # Orden cronológico descendente (los más nuevos primero)
+            .limit(fetch_limit)
+            .execute()
+        )
+
+        # Si el objeto response tiene un atributo 'error' y no es None,
+        # consideramos que hubo un error.
+        if hasattr(response, "error") and response.error is not None:
+            print("Error al obtener el histórico:", response.error)
+            return [_row_to_message(row) for row in rows][:limit]
+
+        # Si no hay error, extraemos los datos (sin repetir filas que se escribieron mientras leíamos)
+        vistos = {row["created_at"] for row in rows}
+        rows.extend(row for row in (response.data or []) if row.get("created_at") not in vistos)
+
+    messages = [_row_to_message(row) for row in rows[:fetch_limit]]
+    _history_cache.put(chat_id, messages, fetch_limit)
+    return messages[:limit]
@@ -20,6 +20,7 @@ class YoutubeDownloader:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(link, download=False)  # Obtener metadata sin descargar
             titulo = info.get('title', 'video_descargado')  # Obtener título del video
+            video_id = info.get('id')
 
         #Carpeta de descarga de los vídeos
         output_path = '_videos_descargados'
@@ -29,7 +30,8 @@ class YoutubeDownloader:
 
         # Limpiar el título del video para que sea un nombre de archivo válido
         title = re.sub(r'[<>:"/\\|?*]', '', titulo).replace("'", "").strip().replace(' ', '_')
-        title = f'_{title}.mp4'
+        # El ID va en el nombre: dos vídeos con el mismo título no se pisan el archivo
+        title = f'_{title}_{video_id}.mp4' if video_id else f'_{title}.mp4'
         video_path = os.path.join(output_path, title)
 
         # Opciones de descarga
@@ -44,6 +46,41 @@ class YoutubeDownloader:
         print(f"Descargado el vídeo '{titulo}' en '{video_path}'")
         return video_path
 
+    def bajar_audio(self, link='https://www.youtube.com/watch?v=zUQxQKoMnOU'):
+        """Descarga solo la mejor pista de audio en una única pasada y la deja en WAV 16 kHz mono, listo para Whisper."""
+        print(f"Descargando audio del enlace: {link}")
+
+        #Carpeta donde Audio.extraer deja los audios, así el resto del pipeline no cambia
+        output_path = '_audios_extraídos_descargados'
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+            print(f"Creada carpeta '{output_path}'")
+
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'format': 'bestaudio/best', # Solo audio; sin vídeo que descargar ni combinar
+            'restrictfilenames': True, # Nombre de archivo sin espacios ni caracteres especiales
+            # El ID va en el nombre: dos vídeos con el mismo título no se pisan el audio ni la transcripción
+            'outtmpl': os.path.join(output_path, '_%(title)s_%(id)s.%(ext)s'),
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'wav',
+            }],
+            # Whisper trabaja a 16 kHz mono: convertimos aquí y Whisper no tiene que volver a remuestrear
+            'postprocessor_args': {
+                'extractaudio': ['-ar', '16000', '-ac', '1'],
+            },
+        }
+
+        # Una sola llamada: metadata + descarga
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(link, download=True)
+
+        audio_path = info['requested_downloads'][0]['filepath']
+        print(f"Descargado el audio de '{info.get('title')}' en '{audio_path}'")
+        return audio_path
+
 # if __name__ == '__main__':
 #     yt = YoutubeDownloader()
 #     link = 'https://www.youtube.com/watch?v=zUQxQKoMnOU'
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+HISTORY_CACHE_MAX_CHATS = int(os.getenv("HISTORY_CACHE_MAX_CHATS", "1000"))
+HISTORY_CACHE_TURNS = int(os.getenv("HISTORY_CACHE_TURNS", "20"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "1800"))  # segundos sin actividad
+
+
+class _Entrada:
+    __slots__ = ("mensajes", "completo", "ultimo_acceso")
+
+    def __init__(self, turns):
+        # Ring buffer por chat: los más nuevos a la izquierda, como devuelve Supabase
+        self.mensajes = deque(maxlen=turns)
+        # True si en Supabase no hay mensajes más antiguos que los del buffer
+        self.completo = False
+        self.ultimo_acceso = time.monotonic()
+
+
+class HistoryCache:
+    """Caché LRU write-through del historial de conversación, por chat_id.
+
+    store_chat_history agrega cada mensaje nuevo a los chats ya cacheados y
+    get_chat_history solo va a Supabase cuando el chat no está en caché.
+    La caché se acota por número de chats (LRU) y por tiempo sin actividad (TTL).
+    """
+
+    def __init__(self, max_chats=HISTORY_CACHE_MAX_CHATS, turns=HISTORY_CACHE_TURNS, ttl=HISTORY_CACHE_TTL):
+        self.__max_chats = max_chats
+        self.__turns = turns
+        self.__ttl = ttl
+        self.__chats = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def __vigente(self, chat_id, ahora):
+        entrada = self.__chats.get(chat_id)
+        if entrada is None:
+            return None
+        if ahora - entrada.ultimo_acceso > self.__ttl:
+            del self.__chats[chat_id]
+            self.__evictions += 1
+            return None
+        return entrada
+
+    def get(self, chat_id, limit):
+        """Devuelve los últimos `limit` mensajes (más nuevos primero) o None si hay que ir a Supabase."""
+        ahora = time.monotonic()
+        with self.__lock:
+            entrada = self.__vigente(chat_id, ahora)
+            if entrada is not None and (limit <= len(entrada.mensajes) or entrada.completo):
+                entrada.ultimo_acceso = ahora
+                self.__chats.move_to_end(chat_id)
+                self.__hits += 1
+                return list(entrada.mensajes)[:limit]
+            self.__misses += 1
+            return None
+
+    def put(self, chat_id, mensajes, limit):
+        """Carga el historial leído de Supabase (más nuevos primero)."""
+        with self.__lock:
+            entrada = _Entrada(self.__turns)
+            entrada.mensajes.extend(mensajes[:self.__turns])
+            # Si Supabase devolvió menos de lo pedido, tenemos todo el historial del chat
+            entrada.completo = len(mensajes) < limit
+            self.__chats[chat_id] = entrada
+            self.__chats.move_to_end(chat_id)
+            while len(self.__chats) > self.__max_chats:
+                self.__chats.popitem(last=False)
+                self.__evictions += 1
+
+    def append(self, chat_id, mensaje):
+        """Write-through: agrega un mensaje nuevo si el chat ya está en caché."""
+        ahora = time.monotonic()
+        with self.__lock:
+            entrada = self.__vigente(chat_id, ahora)
+            if entrada is None:
+                return
+            if len(entrada.mensajes) == entrada.mensajes.maxlen:
+                # El ring buffer descarta el más antiguo: ya no tenemos todo el historial
+                entrada.completo = False
+            entrada.mensajes.appendleft(mensaje)
+            entrada.ultimo_acceso = ahora
+            self.__chats.move_to_end(chat_id)
+
+    def invalidate(self, chat_id=None):
+        with self.__lock:
+            if chat_id is None:
+                self.__chats.clear()
+            else:
+                self.__chats.pop(chat_id, None)
+
+    def metrics(self):
+        with self.__lock:
+            total = self.__hits + self.__misses
+            return {
+                "chats": len(self.__chats),
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "hit_rate": self.__hits / total if total else 0.0,
+                "evictions": self.__evictions,
+            }
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "_cache_media")
+
+# Formatos de enlace de YouTube: watch?v=, youtu.be/, shorts/, embed/, live/
+_YOUTUBE_ID = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([A-Za-z0-9_-]{11})')
+
+
+def youtube_video_id(link):
+    """Extrae el ID del vídeo de un enlace de YouTube, o None si no lo reconoce."""
+    match = _YOUTUBE_ID.search(link or '')
+    return match.group(1) if match else None
+
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+_hash_archivos = {}
+_hash_archivos_lock = threading.Lock()
+
+
+def hash_archivo(path):
+    """SHA-256 del contenido del archivo, memorizado por (ruta, tamaño, mtime) para no releerlo."""
+    stat = os.stat(path)
+    firma = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_archivos_lock:
+        if firma in _hash_archivos:
+            return _hash_archivos[firma]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloque)
+    digest = sha.hexdigest()
+
+    with _hash_archivos_lock:
+        _hash_archivos[firma] = digest
+    return digest
+
+
+class MediaCache:
+    """Caché en disco por contenido para las etapas del pipeline multimedia.
+
+    Cada etapa guarda su resultado en {base_dir}/{etapa}/{clave}.json. Si varias
+    requests piden la misma clave a la vez, solo una ejecuta el cálculo (single-flight)
+    y las demás esperan y reciben el mismo resultado.
+    """
+
+    def __init__(self, base_dir=MEDIA_CACHE_DIR):
+        self.__base_dir = base_dir
+        self.__locks = {}
+        self.__locks_lock = threading.Lock()
+
+    def __ruta(self, etapa, clave):
+        return os.path.join(self.__base_dir, etapa, f'{clave}.json')
+
+    def __lock_para(self, etapa, clave):
+        with self.__locks_lock:
+            return self.__locks.setdefault((etapa, clave), threading.Lock())
+
+    def get(self, etapa, clave, es_ruta=False):
+        ruta = self.__ruta(etapa, clave)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                valor = json.load(f)['valor']
+        except (OSError, ValueError, KeyError):
+            return None
+        # Si el resultado es un archivo y ya no existe, la entrada no sirve
+        if es_ruta and not os.path.exists(valor):
+            return None
+        return valor
+
+    def put(self, etapa, clave, valor):
+        ruta = self.__ruta(etapa, clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'valor': valor, 'creado': time.time()}, f, ensure_ascii=False)
+        os.replace(temporal, ruta) # Escritura atómica
+
+    def get_or_compute(self, etapa, clave, calcular, es_ruta=False):
+        valor = self.get(etapa, clave, es_ruta)
+        if valor is not None:
+            print(f"Caché multimedia: hit en '{etapa}' ({clave})")
+            return valor
+
+        with self.__lock_para(etapa, clave):
+            # Otra request pudo haberlo calculado mientras esperábamos el lock
+            valor = self.get(etapa, clave, es_ruta)
+            if valor is not None:
+                print(f"Caché multimedia: hit en '{etapa}' ({clave}) tras esperar")
+                return valor
+
+            print(f"Caché multimedia: miss en '{etapa}' ({clave})")
+            valor = calcular()
+            self.put(etapa, clave, valor)
+            return valor
+
+
+media_cache = MediaCache()
@@ -0,0 +1,62 @@
+import os
+
+from utils.download_youtube_yt_dlp import YoutubeDownloader
+from utils.audio import Audio, MEDIA_AUDIO_ONLY, WHISPER_MODEL
+from utils.crea_partes_notas import Notes
+from utils.media_cache import media_cache, youtube_video_id, hash_archivo, hash_texto
+
+# Etapas del pipeline multimedia (YouTube -> audio -> transcripción -> nota), cacheadas por contenido.
+# Las usan tanto las tools del agente como services/media_jobs.py. La consulta a la caché y su lock
+# (single-flight) ocurren siempre en el proceso que llama; ejecutar(funcion, *args, **kwargs) decide
+# dónde corre solo el cálculo (por defecto aquí mismo, o en un pool de procesos).
+
+
+def _aqui(funcion, *args, **kwargs):
+    return funcion(*args, **kwargs)
+
+
+def descargar_youtube(link):
+    """Descarga un video (o solo su audio, con MEDIA_AUDIO_ONLY) y devuelve la ruta del archivo."""
+    def descargar():
+        if MEDIA_AUDIO_ONLY:
+            # Solo necesitamos el audio para transcribir: nos ahorramos bajar y combinar el vídeo
+            return YoutubeDownloader().bajar_audio(link)
+        return YoutubeDownloader().bajar_video(link)
+
+    # La descarga se cachea por ID de vídeo: el mismo enlace no se vuelve a bajar
+    clave = youtube_video_id(link) or hash_texto(link.strip())
+    clave = f"{clave}-{'audio' if MEDIA_AUDIO_ONLY else 'video'}"
+    return media_cache.get_or_compute('descarga', clave, descargar, es_ruta=True)
+
+
+def extraer_audio(video_path, ejecutar=_aqui):
+    video_path = video_path.replace("'", "").strip()
+    if not os.path.exists(video_path):
+        return ejecutar(Audio.extraer, video_path)
+    clave = hash_archivo(video_path)
+    # El hash va en el nombre del audio: otro video con el mismo nombre no pisa el que apunta la caché
+    return media_cache.get_or_compute(
+        'audio', clave, lambda: ejecutar(Audio.extraer, video_path, sufijo=clave[:12]), es_ruta=True
+    )
+
+
+def transcribir_audio(audio_path, ejecutar=_aqui):
+    audio_path = audio_path.replace("'", "").strip()
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"El archivo de audio no existe: {audio_path}")
+    # La transcripción se cachea por el contenido del audio y el modelo Whisper usado,
+    # y el hash va también en el nombre del .md para que otro audio homónimo no lo pise
+    clave = hash_archivo(audio_path)
+    transcripcion_path = media_cache.get_or_compute(
+        'transcripcion',
+        f'{clave}-{WHISPER_MODEL}',
+        lambda: ejecutar(Audio.transcribir, audio_path, sufijo=clave[:12]),
+        es_ruta=True,
+    )
+    if not os.path.exists(transcripcion_path):
+        raise FileNotFoundError(f"El archivo de transcripción no existe: {transcripcion_path}")
+    return transcripcion_path
+
+
+def crear_nota(transcripcion_path):
+    return Notes.guardar_nota(transcripcion_path)
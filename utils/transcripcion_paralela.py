@@ -0,0 +1,116 @@
+"""
+Transcripción de audios largos en paralelo.
+
+El audio se divide en chunks en los silencios detectados por el VAD de faster-whisper,
+cada chunk se transcribe en un proceso distinto (cada uno con su propio modelo Whisper)
+y los segmentos se devuelven en orden, con timestamps relativos al audio completo.
+
+Este módulo no importa utils.audio a propósito: los procesos hijos solo cargan lo
+necesario para transcribir.
+"""
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+SAMPLING_RATE = 16000
+
+Segmento = namedtuple("Segmento", ["start", "end", "text"])
+
+
+#------------------------------ Código que corre en los procesos hijos ------------------------------
+_modelo = None
+
+
+def _init_worker(model_size, device, compute_type, cpu_threads):
+    global _modelo
+    _modelo = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribir_chunk(audio, offset, beam_size, language):
+    segments, _ = _modelo.transcribe(audio, beam_size=beam_size, language=language)
+    return [Segmento(offset + s.start, offset + s.end, s.text.strip()) for s in segments]
+#----------------------------------------------------------------------------------------------------
+
+
+def dividir_en_chunks(audio, chunk_seconds, min_silence_ms=500):
+    """Devuelve [(inicio, fin)] en muestras, cortando solo en silencios y con chunks de ~chunk_seconds."""
+    habla = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=min_silence_ms))
+    if not habla:
+        return []
+
+    objetivo = int(chunk_seconds * SAMPLING_RATE)
+    chunks = []
+    inicio = habla[0]["start"]
+    for actual, siguiente in zip(habla, habla[1:]):
+        if actual["end"] - inicio >= objetivo:
+            # Cortamos en la mitad del silencio entre dos tramos de habla
+            corte = (actual["end"] + siguiente["start"]) // 2
+            chunks.append((inicio, corte))
+            inicio = corte
+    chunks.append((inicio, habla[-1]["end"]))
+    return chunks
+
+
+class TranscriptorParalelo:
+    """Reparte los chunks de un audio entre un pool de procesos, cada uno con un modelo cargado."""
+
+    def __init__(self, model_size, device, compute_type, processes=None, beam_size=5,
+                 chunk_seconds=60, language=None):
+        self.__processes = processes or max(1, (os.cpu_count() or 2) // 2)
+        # Repartimos los hilos de CPU entre procesos para no sobresuscribir los núcleos
+        cpu_threads = max(1, (os.cpu_count() or 1) // self.__processes)
+        self.__init_args = (model_size, device, compute_type, cpu_threads)
+        self.__beam_size = beam_size
+        self.__chunk_seconds = chunk_seconds
+        self.__language = language
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def __get_executor(self):
+        with self.__lock:
+            if self.__executor is None:
+                # spawn: la app tiene hilos vivos y hacer fork con hilos no es seguro
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.__processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=self.__init_args,
+                )
+            return self.__executor
+
+    def transcribir_stream(self, audio_path):
+        """Generador de Segmento en orden; entrega cada chunk en cuanto él y los anteriores terminan."""
+        audio = decode_audio(audio_path, sampling_rate=SAMPLING_RATE)
+        chunks = dividir_en_chunks(audio, self.__chunk_seconds)
+        print(f"Audio dividido en {len(chunks)} chunks para {self.__processes} procesos")
+
+        executor = self.__get_executor()
+        futures = [
+            executor.submit(
+                _transcribir_chunk,
+                audio[inicio:fin],
+                inicio / SAMPLING_RATE,
+                self.__beam_size,
+                self.__language,
+            )
+            for inicio, fin in chunks
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            # Si el consumidor abandona el stream, no seguimos gastando CPU
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(cancel_futures=True)
+                self.__executor = None
@@ -0,0 +1,208 @@
+import atexit
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from utils.db_utils import get_supabase_client, get_chat_history
+from utils.history_cache import HISTORY_CACHE_TURNS
+
+# Perfil del usuario por chat (nombre, correo, programa de interés, despedida).
+# Se actualiza con cada mensaje nuevo y se lee en O(1) al armar los prompts.
+#
+# Tabla en Supabase:
+#   create table user_profile (
+#       chat_id text primary key,
+#       nombre text,
+#       correo text,
+#       programa_interes text,
+#       despidiendose boolean not null default false,
+#       updated_at timestamptz not null default now()
+#   );
+USER_PROFILE_MAX_CHATS = int(os.getenv("USER_PROFILE_MAX_CHATS", "1000"))
+USER_PROFILE_FLUSH_INTERVAL = float(os.getenv("USER_PROFILE_FLUSH_INTERVAL", "2.0"))
+
+CAMPOS = ("nombre", "correo", "programa_interes", "despidiendose")
+
+# Los patrones se compilan una sola vez al importar el módulo
+_NOMBRE = re.compile(r"\b(?:mi nombre es|me llamo)\s+([a-záéíóúüñ]+)")
+_CORREO = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PROGRAMA = re.compile(r"ai engineer|data engineer|data analyst|machine learning|data scientist")
+_DESPEDIDA = re.compile(
+    "|".join(map(re.escape, [
+        "eso es todo", "gracias por la información",
+        "muchas gracias", "eso sería todo", "adiós",
+        "hasta luego", "chao", "nos vemos", "listo",
+        "bueno muchas gracias", "hasta pronto",
+    ]))
+)
+# Saludos personalizados del bot: "¡Hola Ana! ..." o "Gracias por proporcionar tus datos, Ana!".
+# "¡Hola de nuevo!" es una frase de las plantillas, no un nombre
+_SALUDO_BOT = re.compile(r"(?:hola|gracias por proporcionar tus datos,)\s+(?!de nuevo\b)([^!¡?,.\n]{1,40})!")
+
+
+def perfil_vacio():
+    return {"nombre": None, "correo": None, "programa_interes": None, "despidiendose": False}
+
+
+def aplicar_mensaje(perfil, es_usuario, mensaje):
+    """Actualiza el perfil con un mensaje nuevo. Devuelve True si algo cambió."""
+    texto = (mensaje or "").lower()
+    antes = dict(perfil)
+
+    if es_usuario:
+        # Lo más reciente manda: si el usuario corrige un dato, se queda el nuevo
+        match = _NOMBRE.search(texto)
+        if match:
+            perfil["nombre"] = match.group(1).title()
+        match = _CORREO.search(texto)
+        if match:
+            perfil["correo"] = match.group(0)
+        match = _PROGRAMA.search(texto)
+        if match:
+            perfil["programa_interes"] = match.group(0)
+        perfil["despidiendose"] = _DESPEDIDA.search(texto) is not None
+    elif not perfil["nombre"]:
+        # El bot solo aporta el nombre si el usuario nunca lo dijo explícitamente
+        match = _SALUDO_BOT.search(texto)
+        if match:
+            perfil["nombre"] = match.group(1).strip().title()
+
+    return perfil != antes
+
+
+def perfil_desde_historial(history_messages):
+    """Arma un perfil a partir de un historial (más nuevos primero). Solo para chats sin perfil guardado."""
+    perfil = perfil_vacio()
+    for message in reversed(history_messages or []):
+        aplicar_mensaje(perfil, message.get("isUser", False), message.get("body"))
+    return perfil
+
+
+class UserProfileStore:
+    """Perfiles por chat en memoria (LRU), persistidos en Supabase con write-behind.
+
+    actualizar() aplica cada mensaje nuevo con los patrones precompilados; solo si el
+    perfil cambió se marca para escribir. get() nunca recorre el historial: la única
+    vez que se lee es para migrar un chat que todavía no tiene fila en user_profile.
+    """
+
+    def __init__(self, max_chats=USER_PROFILE_MAX_CHATS, flush_interval=USER_PROFILE_FLUSH_INTERVAL):
+        self.__max_chats = max_chats
+        self.__flush_interval = flush_interval
+        self.__perfiles = OrderedDict()
+        self.__sucios = {}  # chat_id -> copia del perfil pendiente de escribir
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__thread = None
+
+        # Métricas
+        self.__hits = 0
+        self.__loads = 0
+        self.__updates = 0
+        self.__writes = 0
+
+    def __cargar(self, chat_id):
+        perfil = None
+        try:
+            response = (
+                get_supabase_client().table("user_profile")
+                .select(", ".join(CAMPOS))
+                .eq("chat_id", chat_id)
+                .limit(1)
+                .execute()
+            )
+            if response.data:
+                perfil = perfil_vacio()
+                perfil.update({campo: response.data[0].get(campo) for campo in CAMPOS})
+                perfil["despidiendose"] = bool(perfil["despidiendose"])
+            else:
+                # Chat anterior a esta tabla: lo migramos una vez desde su historial reciente
+                perfil = perfil_desde_historial(get_chat_history(chat_id, limit=HISTORY_CACHE_TURNS))
+        except Exception as e:
+            print(f"Error al cargar el perfil del chat {chat_id}: {e}")
+            perfil = perfil_vacio()
+        with self.__lock:
+            self.__loads += 1
+        return perfil
+
+    def __entrada(self, chat_id):
+        """Devuelve el perfil cacheado (cargándolo si hace falta). Se llama sin el lock tomado."""
+        with self.__lock:
+            perfil = self.__perfiles.get(chat_id)
+            if perfil is not None:
+                self.__perfiles.move_to_end(chat_id)
+                self.__hits += 1
+                return perfil
+            # Expulsado con cambios sin escribir: Supabase todavía tiene la versión vieja
+            pendiente = self.__sucios.get(chat_id)
+
+        perfil = dict(pendiente) if pendiente is not None else self.__cargar(chat_id)
+        with self.__lock:
+            # Otro hilo pudo cargarlo mientras tanto: nos quedamos con el que ya está
+            perfil = self.__perfiles.setdefault(chat_id, perfil)
+            self.__perfiles.move_to_end(chat_id)
+            # Expulsar no pierde cambios: lo pendiente de escribir vive aparte en __sucios
+            while len(self.__perfiles) > self.__max_chats:
+                self.__perfiles.popitem(last=False)
+        return perfil
+
+    def get(self, chat_id):
+        """Copia del perfil del chat (vacío si chat_id es None)."""
+        if chat_id is None:
+            return perfil_vacio()
+        perfil = self.__entrada(chat_id)
+        with self.__lock:
+            return dict(perfil)
+
+    def actualizar(self, chat_id, sender, mensaje):
+        perfil = self.__entrada(chat_id)
+        with self.__lock:
+            if not aplicar_mensaje(perfil, sender == "user", mensaje):
+                return
+            self.__updates += 1
+            self.__sucios[chat_id] = dict(perfil)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="user-profile-flusher", daemon=True)
+                self.__thread.start()
+
+    def flush(self):
+        with self.__flush_lock:
+            with self.__lock:
+                if not self.__sucios:
+                    return
+                ahora = datetime.now(timezone.utc).isoformat()
+                filas = [{"chat_id": chat_id, **perfil, "updated_at": ahora} for chat_id, perfil in self.__sucios.items()]
+                self.__sucios = {}
+            try:
+                get_supabase_client().table("user_profile").upsert(filas).execute()
+                with self.__lock:
+                    self.__writes += len(filas)
+            except Exception as e:
+                print("Error al guardar los perfiles, se reintentará:", e)
+                with self.__lock:
+                    # Si el chat cambió de nuevo mientras tanto, su versión más nueva tiene prioridad
+                    for fila in filas:
+                        self.__sucios.setdefault(fila["chat_id"], {campo: fila[campo] for campo in CAMPOS})
+
+    def __run(self):
+        while True:
+            time.sleep(self.__flush_interval)
+            self.flush()
+
+    def metrics(self):
+        with self.__lock:
+            return {
+                "chats": len(self.__perfiles),
+                "hits": self.__hits,
+                "loads": self.__loads,
+                "updates": self.__updates,
+                "pending_writes": len(self.__sucios),
+                "writes": self.__writes,
+            }
+
+
+user_profiles = UserProfileStore()
+atexit.register(user_profiles.flush)